@@ -0,0 +1,142 @@
+from collections import OrderedDict
+import pygame as pg
+
+import config as cf
+from sensors import footprint
+
+
+class LRUCache:
+    """
+    Represents a dictionary that evicts its least recently used entries.
+
+    Attributes:
+    - capacity (int): The maximum number of entries.
+    - hits, misses (int): Counters of the lookups.
+
+    Methods:
+    - get(key, create): Return the value of key, creating it with create() if missing.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, create):
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        value = self.entries[key] = create()
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        return value
+
+
+_car_image = None
+_tinted = LRUCache(cf.ASSET_CACHE_SIZE)
+_rotated = LRUCache(cf.ASSET_CACHE_SIZE)
+_masks = LRUCache(cf.ASSET_CACHE_SIZE)
+_footprints = LRUCache(cf.ASSET_CACHE_SIZE)
+
+
+def quantize(angle):
+    """Return the angle rounded to cf.ROTATION_RESOLUTION degrees in [0, 360).
+
+    Args:
+        angle (float): The angle in degrees.
+
+    Returns:
+        float: The quantized angle, or the exact angle if the resolution is 0.
+    """
+    if cf.ROTATION_RESOLUTION:
+        angle = round(angle / cf.ROTATION_RESOLUTION) * cf.ROTATION_RESOLUTION
+    return angle % 360
+
+
+def recolor(image, color):
+    """Return a copy of the image filled with color, preserving transparency.
+
+    Args:
+        image (pygame.Surface): The image to recolor.
+        color (tuple): The color to recolor with, RGBA format.
+
+    Returns:
+        pygame.Surface: The recolored image.
+    """
+    tinted = image.copy()
+    pixels = pg.surfarray.pixels3d(tinted)
+    pixels[:] = color[:3]
+    del pixels
+    return tinted
+
+
+def get_car_image():
+    """Return the car image, loaded from disk only once.
+
+    Returns:
+        pygame.Surface: The car image.
+    """
+    global _car_image
+    if _car_image is None:
+        image = pg.image.load(cf.CAR_IMAGE)
+        _car_image = image.convert_alpha() if pg.display.get_surface() is not None else image
+    return _car_image
+
+
+def get_tinted(color):
+    """Return the car image recolored with the given species color.
+
+    Args:
+        color (tuple): The color of the car, RGBA format.
+
+    Returns:
+        pygame.Surface: The recolored car image.
+    """
+    color = tuple(color)
+    return _tinted.get(color, lambda: recolor(get_car_image(), color))
+
+
+def get_rotated(color, angle):
+    """Return the recolored car image rotated by the quantized angle.
+
+    Args:
+        color (tuple): The color of the car, RGBA format.
+        angle (float): The rotation in degrees.
+
+    Returns:
+        pygame.Surface: The rotated car image.
+    """
+    color, angle = tuple(color), quantize(angle)
+    return _rotated.get((color, angle), lambda: pg.transform.rotate(get_tinted(color), angle))
+
+
+def get_mask(angle):
+    """Return the mask of the car image rotated by the quantized angle.
+
+    Args:
+        angle (float): The rotation in degrees.
+
+    Returns:
+        pygame.Mask: The mask of the rotated car image.
+    """
+    angle = quantize(angle)
+    return _masks.get(angle, lambda: pg.mask.from_surface(pg.transform.rotate(get_car_image(), angle)))
+
+
+def get_footprint(angle):
+    """Return the collision points of the car mask rotated by the quantized angle.
+
+    Args:
+        angle (float): The rotation in degrees.
+
+    Returns:
+        numpy.ndarray: The (x, y) points within the mask, shape (2, k).
+    """
+    angle = quantize(angle)
+    return _footprints.get(angle, lambda: footprint(get_mask(angle)))
@@ -0,0 +1,28 @@
+import contextlib
+import os
+
+
+@contextlib.contextmanager
+def atomic_write(path, suffix=""):
+    """Write a file through a temporary file that replaces it at the end, so
+    a crash or a concurrent run never sees a partially written file.
+
+    If writing raises, the temporary file is removed and the file at the
+    path is left as it was.
+
+    Args:
+        path (str): The path of the file.
+        suffix (str): The extension of the temporary file, for writers that
+            add one to paths without it.
+
+    Yields:
+        str: The path of the temporary file to write.
+    """
+    temporary = f"{path}.{os.getpid()}.tmp{suffix}"
+    try:
+        yield temporary
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
@@ -0,0 +1,71 @@
+"""Benchmark NEAT.genetic_difference against the former nested-loop version
+for growing genome sizes.
+
+Run from the repository root:
+    python -m benchmarks.genetic_difference
+"""
+import copy
+import random as rnd
+import timeit
+
+import config as cf
+from neat import NEAT, NeuralNetwork
+
+SIZES = [10, 50, 100, 200, 400, 800]
+
+
+def nested_loop_difference(nn1, nn2):
+    """The former O(E1*E2) edge alignment, kept for comparison."""
+    disjoint_edges = 0
+    matching_edges = 0
+    weight_difference = 0
+    matched_edges_set = set()
+    for e1 in nn1.edges.values():
+        match_found = False
+        for e2 in nn2.edges.values():
+            if e1.from_node == e2.from_node and e1.to_node == e2.to_node:
+                matching_edges += 1
+                weight_difference += abs(e1.weight - e2.weight)
+                matched_edges_set.add(e2)
+                match_found = True
+                break
+        if not match_found:
+            disjoint_edges += 1
+    excess_edges = len(nn2.edges) - len(matched_edges_set)
+    num_edges = max(len(nn1.edges), len(nn2.edges), 1)
+    return cf.C1 * excess_edges/num_edges + cf.C2 * disjoint_edges/num_edges + cf.C3 * weight_difference
+
+
+def grow(nn, num_edges):
+    """Mutate the network until it has at least num_edges edges."""
+    while len(nn.edges) < num_edges:
+        if rnd.random() < 0.5:
+            nn.add_node()
+        else:
+            nn.add_edge()
+    return nn
+
+
+def time_call(function, *args):
+    """Return the mean time of a call in microseconds."""
+    number, total = 1, 0
+    while total < 0.2:
+        number *= 2
+        total = timeit.timeit(lambda: function(*args), number=number)
+    return total / number * 1e6
+
+
+def main():
+    rnd.seed(0)
+    neat = NEAT()
+    print(f"{'edges':>6} {'nested loop (us)':>17} {'aligned (us)':>13} {'speedup':>8}")
+    for size in SIZES:
+        nn1 = grow(NeuralNetwork(cf.NUM_INPUTS, cf.NUM_OUTPUTS), size)
+        nn2 = grow(copy.deepcopy(nn1), size + size//10)
+        nested = time_call(nested_loop_difference, nn1, nn2)
+        aligned = time_call(neat.genetic_difference, nn1, nn2)
+        print(f"{len(nn1.edges):>6} {nested:>17.1f} {aligned:>13.1f} {nested/aligned:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
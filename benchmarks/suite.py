@@ -0,0 +1,327 @@
+"""Benchmark the hot paths of the simulation and the evolution.
+
+Every benchmark starts from fixed seeds and runs without a display. The
+results are written as JSON and can be compared against a baseline file,
+slower benchmarks are flagged as regressions.
+
+Run from the repository root:
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --baseline results.json
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import random as rnd
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+import pygame as pg
+
+import assets
+import config as cf
+import neat
+from benchmarks.genetic_difference import grow
+from car import Car
+from neat import NEAT, NetworkBatch, NeuralNetwork, Species
+from policy import Policy
+from population import Population
+from simulation import Simulation
+from track import Track
+
+GENOME_SIZES = [10, 50, 200]
+POPULATION_SIZES = [50, 200]
+# Sensor readings per call of the policy benchmark, its throughput is this over the time:
+POLICY_BATCH = 4096
+SEED = 0
+
+
+def seed():
+    rnd.seed(SEED)
+    np.random.seed(SEED)
+    neat.innovations.clear()
+
+
+def measure(function, setup=None, repeat=10, min_time=0.1):
+    """Return the fastest time of a call in seconds over several repeats.
+
+    Interruptions by other processes only ever make a repeat slower, so the
+    fastest repeat varies far less between runs than the median.
+
+    Args:
+        function (callable): The function to time.
+        setup (callable): Returns the arguments of a call and is not
+            timed. When given, every call gets fresh arguments.
+        repeat (int): The number of repeats.
+        min_time (float): The minimum duration of a repeat in seconds.
+
+    Returns:
+        float: The fastest time of a call in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        calls, total = 0, 0
+        while not calls or total < min_time:
+            args = setup() if setup else ()
+            start = time.perf_counter()
+            function(*args)
+            total += time.perf_counter() - start
+            calls += 1
+        times.append(total / calls)
+    return min(times)
+
+
+def grown_network(num_edges):
+    return grow(NeuralNetwork(cf.NUM_INPUTS, cf.NUM_OUTPUTS), num_edges)
+
+
+def grown_neat(size):
+    """Return a NEAT instance of the given population size with grown
+    networks and random fitnesses."""
+    population_size = cf.POPULATION_SIZE
+    cf.POPULATION_SIZE = size
+    try:
+        instance = NEAT()
+    finally:
+        cf.POPULATION_SIZE = population_size
+    for nn in instance.get_individuals():
+        for _ in range(rnd.randint(0, 10)):
+            nn.mutate()
+        nn.fitness = rnd.uniform(0, 1000)
+    return instance
+
+
+def bench_feed_forward(track, size):
+    nn = grown_network(size)
+    inputs = [rnd.uniform(0, 100) for _ in range(cf.NUM_INPUTS)]
+    return measure(lambda: nn.feed_forward(inputs))
+
+
+def bench_policy_predict(track, size):
+    policy = Policy.from_network(grown_network(size))
+    inputs = np.random.uniform(0, cf.CAR_MAX_VIEW_DISTANCE, (POLICY_BATCH, cf.NUM_INPUTS))
+    return measure(lambda: policy.predict(inputs))
+
+
+def bench_policy_load(track, size):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "policy.npz")
+        Policy.from_network(grown_network(size)).save(path)
+        return measure(lambda: Policy.load(path))
+
+
+def bench_genetic_difference(track, size):
+    instance = NEAT()
+    nn1 = grown_network(size)
+    nn2 = grow(copy.deepcopy(nn1), size + size//10)
+    return measure(lambda: instance.genetic_difference(nn1, nn2))
+
+
+def bench_batch_replace(track, size):
+    networks = [grown_network(20) for _ in range(size)]
+    batch = NetworkBatch(networks)
+    replacements = [grown_network(20) for _ in range(5)]
+    rows = list(range(0, size, size//5))[:5]
+    return measure(lambda: batch.replace(rows, replacements))
+
+
+def bench_speciate(track, size):
+    instance = grown_neat(size)
+    # Every species keeps one member, so each call compares against all of them:
+    for species in instance.population:
+        species.keep(1)
+    individual = grown_network(50)
+
+    def speciate():
+        instance.speciate(individual)
+        species = next(s for s in instance.population if individual in s.members)
+        species.remove(individual)
+        if not species.members:
+            instance.population.remove(species)
+    return measure(speciate)
+
+
+def bench_speciate_all(track, size):
+    instance = grown_neat(size)
+    # Every species keeps one member, and the offspring are new and varied:
+    for species in instance.population:
+        species.keep(1)
+    offspring = [grown_network(rnd.randint(10, 50)) for _ in range(size)]
+
+    def setup():
+        population = [Species(list(species.members)) for species in instance.population]
+        return (NEAT(population), offspring)
+    return measure(NEAT.speciate_all, setup=setup)
+
+
+def cars_on_track(track, size):
+    """Return a population of cars spread along their first steps on the track."""
+    networks = [grown_network(20) for _ in range(size)]
+    population = Population(networks, track.start)
+    for _ in range(30):
+        population.step(track.mask, track.field)
+    population.crashed[:] = False
+    return population, [Car(population, i, (255, 0, 0, 255)) for i in range(size)]
+
+
+def bench_get_inputs(track, size):
+    population, cars = cars_on_track(track, 1)
+    return measure(lambda: cars[0].get_inputs(track.mask))
+
+
+def bench_sense(track, size):
+    population, cars = cars_on_track(track, size)
+    indices = np.arange(size)
+    field = track.field if cf.RAY_SENSOR == "distance_field" else None
+    return measure(lambda: population.sense(indices, track.mask, field))
+
+
+def bench_update_collision(track, size):
+    population, cars = cars_on_track(track, 1)
+    return measure(lambda: cars[0].update_collision(track.mask))
+
+
+def bench_population_collision(track, size):
+    population, cars = cars_on_track(track, size)
+    indices = np.arange(size)
+    return measure(lambda: population.update_collision(indices, track.mask))
+
+
+def bench_footprint_collision(track, size):
+    population, cars = cars_on_track(track, size)
+    indices = np.arange(size)
+    population.footprints = [assets.get_footprint(angle - population.start_angle)
+                             for angle in population.angle.tolist()]
+    return measure(lambda: population.update_collision(indices, track.mask, track.road, track.field))
+
+
+def bench_evolve(track, size):
+    instance = grown_neat(size)
+
+    # The population is refilled to its size with offspring:
+    def evolve(instance):
+        population_size = cf.POPULATION_SIZE
+        cf.POPULATION_SIZE = size
+        try:
+            instance.evolve()
+        finally:
+            cf.POPULATION_SIZE = population_size
+    return measure(evolve, setup=lambda: (copy.deepcopy(instance),))
+
+
+def bench_generation(track, size):
+    def setup():
+        seed()
+        return (Simulation(track_paths=[track.path], workers=1),)
+    return measure(Simulation.run_generation, setup=setup, repeat=3, min_time=0)
+
+
+# The benchmarks by name, with the sizes they run at:
+BENCHMARKS = {
+    "feed_forward": (bench_feed_forward, GENOME_SIZES),
+    "policy_predict": (bench_policy_predict, GENOME_SIZES),
+    "policy_load": (bench_policy_load, GENOME_SIZES),
+    "genetic_difference": (bench_genetic_difference, GENOME_SIZES),
+    "batch_replace": (bench_batch_replace, POPULATION_SIZES),
+    "speciate": (bench_speciate, POPULATION_SIZES),
+    "speciate_all": (bench_speciate_all, POPULATION_SIZES),
+    "car_get_inputs": (bench_get_inputs, [1]),
+    "population_sense": (bench_sense, POPULATION_SIZES),
+    "car_update_collision": (bench_update_collision, [1]),
+    "population_update_collision": (bench_population_collision, POPULATION_SIZES),
+    "population_footprint_collision": (bench_footprint_collision, POPULATION_SIZES),
+    "evolve": (bench_evolve, POPULATION_SIZES),
+    "generation": (bench_generation, [cf.POPULATION_SIZE]),
+}
+
+
+def run(names):
+    """Run the benchmarks and return their results.
+
+    Args:
+        names (list): The names of the benchmarks to run.
+
+    Returns:
+        dict: The fastest seconds per call of every benchmark and size.
+    """
+    track = Track(cf.TRACK_IMAGE)
+    results = {}
+    for name in names:
+        function, sizes = BENCHMARKS[name]
+        for size in sizes:
+            seed()
+            key = f"{name}[{size}]"
+            results[key] = function(track, size)
+            print(f"{key:<36} {results[key]*1e6:>14.1f} us", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print the change of every benchmark relative to the baseline.
+
+    Args:
+        results (dict): The results of this run.
+        baseline (dict): The results of the baseline run.
+        threshold (float): The relative slowdown flagged as a regression.
+
+    Returns:
+        list: The names of the benchmarks that regressed.
+    """
+    regressions = []
+    print(f"{'benchmark':<36} {'baseline (us)':>14} {'current (us)':>14} {'change':>8}", file=sys.stderr)
+    for key, seconds in results.items():
+        if key not in baseline:
+            continue
+        change = seconds / baseline[key] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(key)
+            flag = " REGRESSION"
+        print(f"{key:<36} {baseline[key]*1e6:>14.1f} {seconds*1e6:>14.1f} {change:>+8.1%}{flag}",
+              file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="file to write the JSON results to, stdout by default")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="relative slowdown flagged as a regression (default 0.25)")
+    parser.add_argument("benchmarks", nargs="*",
+                        help=f"the benchmarks to run, all by default: {', '.join(BENCHMARKS)}")
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    pg.init()
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pygame": pg.version.ver,
+        "machine": platform.machine(),
+        "seed": SEED,
+        "results": run(args.benchmarks or list(BENCHMARKS)),
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(report["results"], json.load(file)["results"], args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,48 +2,69 @@ import math
 import pygame as pg
 import numpy as np
 
+import assets
 import config as cf
+from sensors import march_ray
 
 
 class Car:
+    """
+    Represents a single car of a Population.
+
+    The state of the car lives in the population's arrays, this class is a
+    view on one row of them used for rendering and selecting the car.
+    """
     HALF_FOV = cf.CAR_FOV/2
     VIEW_ANGLES = np.linspace(-HALF_FOV, HALF_FOV, cf.NUM_INPUTS).tolist()
 
-    def __init__(self, x0, y0, start_angle, nn, color):
-        self.x, self.y = x0, y0
-        self.start_angle = start_angle
-        self.angle = start_angle
-        self.has_crashed = False
-        self.steering = 0
-        self.speed = 0
-        self.nn = nn
-        self.image = pg.image.load(cf.CAR_IMAGE).convert_alpha()
-        self.mask = pg.mask.from_surface(self.image)
+    def __init__(self, population, index, color):
+        self.population = population
+        self.index = index
+        self.nn = population.networks[index]
+        self.start_angle = population.start_angle
         self.color = color
-        self.recolor(self.color)
+        self.image = assets.get_tinted(color)
         self.width = self.image.get_rect().center[0]
 
-    def update(self, track_mask, window):
-        """Update the car's state.
+    @property
+    def x(self):
+        return self.population.x[self.index]
 
-        Args:
-            track_mask (pygame.Mask): Pygame mask of the track.
-            window (pygame.Surface): The window to blit the car's image onto.
-        """
-        if not self.has_crashed:
-            self.inputs = self.get_inputs(track_mask, window)
-            self.speed, self.steering = self.nn.feed_forward(self.inputs)
-            self.speed *= cf.CAR_SPEED_MULTIPLIER
-            self.steering *= cf.CAR_STEER_MULTIPLIER
-            if self.speed > cf.CAR_MAX_SPEED:
-                self.speed = cf.CAR_MAX_SPEED
-            if self.speed < cf.CAR_MIN_SPEED:
-                self.speed = cf.CAR_MIN_SPEED
-            self.update_pos_and_angle()
-            self.update_fitness()
-            self.update_collision(track_mask)
-            self.outputs = self.speed, self.steering
-        self.draw(window)
+    @property
+    def y(self):
+        return self.population.y[self.index]
+
+    @property
+    def angle(self):
+        return self.population.angle[self.index]
+
+    @property
+    def speed(self):
+        return self.population.speed[self.index]
+
+    @property
+    def steering(self):
+        return self.population.steering[self.index]
+
+    @property
+    def has_crashed(self):
+        return self.population.crashed[self.index]
+
+    @property
+    def fitness(self):
+        return self.population.fitness[self.index]
+
+    @property
+    def mask(self):
+        return self.population.masks[self.index]
+
+    @property
+    def inputs(self):
+        return self.population.inputs[self.index]
+
+    @property
+    def outputs(self):
+        return self.speed, self.steering
 
     def update_collision(self, track_mask):
         """Check for collision and update the has_crashed flag if a crash occurs.
@@ -52,101 +73,69 @@ class Car:
             track_mask (pygame.Mask): Pygame mask of the track.
         """
         if not track_mask.overlap_area(self.mask, (self.x, self.y)) == self.mask.count():
-            self.has_crashed = True
+            self.population.crashed[self.index] = True
 
     def draw(self, window):
-        """Blit the car onto the window and update its mask.
+        """Blit the car onto the window.
 
         Args:
             window (pygame.Surface): The window to blit the car's image onto.
-        """
-        rotated = pg.transform.rotate(self.image, self.angle-self.start_angle)
-        window.blit(rotated, (self.x, self.y))
-        self.mask = pg.mask.from_surface(rotated)
 
-    def update_pos_and_angle(self):
-        """Use the car's velocity and steering to update the car's position and angle."""
-        vx, vy = self.get_2D_components(self.speed, self.angle)
-        self.x += vx
-        self.y += vy
-
-        if abs(self.steering) > cf.CAR_MAX_TURN:
-            self.steering /= abs(self.steering)
-            self.steering *= cf.CAR_MAX_TURN
-        self.angle += self.steering
-
-    def update_fitness(self):
-        """Update the fitness of the car."""
-        self.nn.fitness += self.speed  # Distance based fitness.
-        # self.nn.fitness += 1 # Time based fitness.
+        Returns:
+            pygame.Rect: The area of the window that was drawn.
+        """
+        rotated = assets.get_rotated(self.color, self.angle-self.start_angle)
+        rect = window.blit(rotated, (self.x, self.y))
+        if cf.SHOW_RAYS:
+            rect.union_ip(self.draw_rays(window))
+        return rect
 
-    def get_2D_components(self, vector, angle):
-        """Return the horizontal and vertical components of a 2D vector.
+    def draw_rays(self, window):
+        """Draw the car's rays as far as its last sensor readings reach.
 
         Args:
-            vector (tuple): The vector which's components are wanted.
-            angle (float): The angle of the vector in the 2D plane in degrees.
+            window (pygame.Surface): The window to draw the rays onto.
 
         Returns:
-            tuple: The x and y components of the 2D vector.
+            pygame.Rect: The area of the window that was drawn.
         """
-        x = vector * math.cos(math.radians(angle))
-        y = vector * -math.sin(math.radians(angle))
-        return x, y
-
-    def get_inputs(self, track_mask, window):
+        x, y = self.get_center()
+        rects = []
+        for angle, reading in zip(Car.VIEW_ANGLES, self.inputs):
+            length = (reading + math.ceil(self.width/2)) * cf.RAY_SPEED
+            radians = math.radians(self.angle + angle)
+            end = (x + math.cos(radians)*length, y - math.sin(radians)*length)
+            rects.append(pg.draw.line(window, self.color, (x, y), end))
+        return rects[0].unionall(rects[1:])
+
+    def get_inputs(self, track_mask):
         """Get the inputs that should be passed onto the NN.
 
         Args:
             track_mask (pygame.Mask): Pygame mask of the track.
-            window (pygame.Surface): The window to blit the car's image onto.
 
         Returns:
             list: Distances of each ray until collision (input to NN).
         """
-        return [self.get_ray_distance(angle, track_mask, window) for angle in Car.VIEW_ANGLES]
+        return [self.get_ray_distance(angle, track_mask) for angle in Car.VIEW_ANGLES]
 
-    def get_ray_distance(self, angle, track_mask, window):
-        """Get the distance to the edge for the ray at the given angle.
+    def get_ray_distance(self, angle, track_mask):
+        """Get the distance to the edge for the ray at the given angle by
+        moving the car's mask along the ray over the track mask.
 
         Args:
             angle (float): The angle of the ray from the car's perspective in degrees.
             track_mask (pygame.Mask): Pygame mask of the track.
-            window (pygame.Surface): The window to blit the car's image onto.
 
         Returns:
-            _type_: _description_
+            int: Distance of the ray until collision.
         """
-
         radians = math.radians(self.angle + angle)
-        ray_direction = (math.cos(radians), -math.sin(radians))
-        half_mask_count = self.mask.count()/2
         x, y = self.get_center()
-        dx, dy = np.subtract(self.get_center(), (self.x, self.y))
-        distance = 0
-        while True:
-            if track_mask.overlap_area(self.mask, (int(x-dx), int(y-dy))) <= half_mask_count or distance >= cf.CAR_MAX_VIEW_DISTANCE:
-                break
-            distance += 1
-            x += ray_direction[0] * cf.RAY_SPEED
-            y += ray_direction[1] * cf.RAY_SPEED
-            if cf.SHOW_RAYS:
-                pg.draw.circle(window, self.color, (x, y), radius=1)
+        offset = np.subtract(self.get_center(), (self.x, self.y))
+        distance = march_ray(track_mask, self.mask, x, y, math.cos(radians), -math.sin(radians), offset)
         return max(0, distance - math.ceil(self.width/2))
 
-    def recolor(self, color):
-        """Fill all pixels of the surface with color, preserve transparency.
-
-        Args:
-            color (tuple): The color to recolor with, RGBA format.
-        """
-        w, h = self.image.get_size()
-        r, g, b, _ = color
-        for x in range(w):
-            for y in range(h):
-                a = self.image.get_at((x, y))[3]
-                self.image.set_at((x, y), pg.Color(r, g, b, a))
-
     def get_center(self):
         """Get the center position of the car in global coordinates.
 
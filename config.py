@@ -7,6 +7,41 @@ GENERATIONS = 100
 SHOW_RAYS = False
 SHOW_NN = True
 RAY_SPEED = 3
+RAY_SENSOR = "distance_field"  # "distance_field", "mask" (per-step mask overlap) or "table" (precomputed).
+RAY_EXACT_HIT = True  # Refine distance field rays with the exact mask overlap test.
+RAY_TOLERANCE = 0  # Steps skipped between exact hit tests, larger values are faster but approximate.
+RAY_FIELD_MAX_DISTANCE = 64
+SENSOR_TABLE_CELL = 4  # Pixels between the car centers of the precomputed sensor table.
+SENSOR_TABLE_HEADINGS = 72  # Headings per turn of the precomputed sensor table.
+SENSOR_TABLE_INTERPOLATE = False  # Interpolate the sensor table between positions and headings.
+SENSOR_TABLE_MAX_BYTES = 256 * 2**20  # Largest sensor table that is built.
+COLLISION = "mask"  # "mask" (per-car mask overlap) or "footprint" (sampled points, vectorized).
+FOOTPRINT_SPACING = 1  # Pixels between sampled interior points, 1 is exact.
+STEPS_PER_SECOND = 60  # Simulated steps per second of simulation time.
+START_STEPS = START_TIME * STEPS_PER_SECOND // 1000
+ADDED_STEPS = ADDED_TIME * STEPS_PER_SECOND // 1000
+FITNESS = "distance"  # "distance" driven or "progress" made along the track.
+PROGRESS_CELL = 4  # Pixels per cell of the track progress field.
+STAGNATION_STEPS = 2 * STEPS_PER_SECOND  # Steps without progress before a car is culled, 0 to disable.
+STAGNATION_DISTANCE = 40  # Progress in pixels a car must make within STAGNATION_STEPS.
+EVOLUTION = "generational"  # "generational" or "steady_state" (finished cars are replaced by offspring at once).
+STEADY_STATE_STEPS = 20 * STEPS_PER_SECOND  # Steps a car drives in steady-state evolution before it is replaced.
+WORKERS = 1  # Processes evaluating headless generations, 1 to evaluate in-process.
+CHUNKS_PER_WORKER = 4  # Genome chunks per worker, more balance uneven generations.
+FITNESS_CACHE_SIZE = 4096  # Evaluations kept to skip unchanged networks in headless generations, 0 to disable.
+CHECKPOINT_PATH = None  # File the population is saved to after every generation, None to disable.
+STATS_PATH = None  # CSV (.csv) or JSONL file the fitness statistics of every generation are appended to.
+STATS_HISTORY = 100  # Generation summaries kept in memory.
+ISLANDS = 1  # Populations evolving in separate processes in headless mode, 1 for a single one.
+MIGRATION_INTERVAL = 10  # Generations between migrations of the fittest networks between islands.
+MIGRANTS = 2  # Fittest networks every island sends to each of its neighbours.
+MIGRATION_TOPOLOGY = "ring"  # "ring" (to the next island) or "complete" (to every other island).
+
+# Profiling:
+PROFILE = False  # Time the phases of every step and count the work done.
+PROFILE_PATH = None  # JSONL file the per-step averages are appended to, None to disable.
+PROFILE_INTERVAL = 60  # Steps averaged per report.
+SHOW_PROFILE = True  # Display the averages in the window while profiling.
 
 # Neural Network:
 NUM_INPUTS = 5
@@ -37,13 +72,23 @@ C3 = 1
 
 # Window:
 FPS = 60
+RENDER_EVERY = 1  # Simulation steps per drawn frame, larger values train faster while watching.
 WIN_WIDTH, WIN_HEIGHT = 1800, 1000
 WIN_TITLE = "Car evolution with NEAT"
 TRACK_IMAGE = "images/track.png"
+TRACK_IMAGES = [TRACK_IMAGE]  # Tracks the fitness is evaluated on, the first is displayed.
+TRACK_CACHE_DIR = ".track_cache"  # Preprocessed tracks are stored here, None to disable.
 CAR_IMAGE = "images/car.png"
+ROTATION_RESOLUTION = 1  # Degrees between cached car rotations, 0 to rotate exactly.
+ASSET_CACHE_SIZE = 2048
 CLICK_RADIUS = 35
 
 
 def species_score(species):
     """Function chosen by the user to evaluate a species' performance."""
     return sum(m.fitness**2 for m in species.members)
+
+
+def track_fitness(fitnesses):
+    """Function chosen by the user to combine a car's fitnesses on all tracks."""
+    return sum(fitnesses) / len(fitnesses)
@@ -0,0 +1,253 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+import config as cf
+from neat import NetworkBatch
+from population import Population
+from profiling import profiler
+from sensors import DistanceField, ProgressField
+from track import road_to_mask
+
+# The tracks of a worker process, attached once by the pool initializer:
+_worker_tracks = []
+
+
+class SharedArray:
+    """
+    Represents a NumPy array in shared memory. Pickling it only sends the
+    name of the memory block, so other processes attach to the same data
+    instead of receiving a copy.
+
+    Attributes:
+    - shape (tuple): The shape of the array.
+    - dtype (str): The data type of the array.
+    - array (numpy.ndarray): The array backed by the shared memory.
+
+    Methods:
+    - close(): Detach from the shared memory, and free it in the process
+        that created it.
+    """
+
+    def __init__(self, array=None, name=None, shape=None, dtype=None):
+        self.owner = array is not None
+        if self.owner:
+            shape, dtype = array.shape, array.dtype.str
+            self.memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.shape, self.dtype = shape, dtype
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self.memory.buf)
+        if self.owner:
+            self.array[...] = array
+
+    def __reduce__(self):
+        return SharedArray, (None, self.memory.name, self.shape, self.dtype)
+
+    def close(self):
+        self.array = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+class WorkerTrack:
+    """
+    Represents a track rebuilt in a worker process from shared arrays.
+
+    Attributes:
+    - road (numpy.ndarray): Boolean array indexed [y, x], True on the road.
+    - mask (pygame.Mask): Pygame mask of the track.
+    - start (tuple): The starting pose (x0, y0, start_angle) of the cars.
+    - field (DistanceField): Distance field of the track for the ray sensors.
+    - progress (ProgressField): Progress along the track from the start.
+    - table (SensorTable): Precomputed ray readings, or None.
+    """
+
+    def __init__(self, road, field, progress, start, table):
+        self.shared = road, field, progress
+        for shared in self.shared:
+            shared.array.flags.writeable = False
+        self.road = road.array
+        self.mask = road_to_mask(self.road)
+        self.start = start
+        self.field = DistanceField(self.mask, self.road, field.array)
+        self.progress = ProgressField(progress.array)
+        self.table = table
+
+
+def _init_worker(tracks):
+    global _worker_tracks
+    _worker_tracks = [WorkerTrack(*track) for track in tracks]
+    # The parent process times the whole evaluation:
+    profiler.enabled = False
+
+
+def simulate(networks, track, step_limit):
+    """Drive a car for every network on the track until all have crashed or
+    the step limit is reached. Every step is a frame of the profiler, timed
+    as a whole as the "evaluation" phase.
+
+    Args:
+        networks (list): The neural networks to evaluate.
+        track (Track): The track to drive on.
+        step_limit (int): The maximum number of steps.
+
+    Returns:
+        tuple: The fitness of every network and the number of steps each car
+            drove, fewer than the step limit if it crashed.
+    """
+    population = Population(networks, track.start, NetworkBatch(networks))
+    field = track.field if cf.RAY_SENSOR == "distance_field" else None
+    steps = 0
+    while steps < step_limit and not population.crashed.all():
+        with profiler.phase("evaluation"):
+            population.step(track.mask, field, track.road, track.progress, track.table)
+        steps += 1
+        profiler.end_frame()
+    return population.fitness.tolist(), population.age.tolist()
+
+
+def reduce_fitness(fitnesses):
+    """Combine the fitnesses of every network on all tracks into one with
+    cf.track_fitness.
+
+    Args:
+        fitnesses (list): The fitness of every network, one list per track.
+
+    Returns:
+        list: The combined fitness of every network.
+    """
+    return [cf.track_fitness(list(values)) for values in zip(*fitnesses)]
+
+
+class FitnessCache:
+    """
+    Represents the fitnesses of evaluated networks, so networks that survive
+    a generation unchanged are not driven again.
+
+    The simulation is deterministic and the cars do not interact, so a
+    network drives exactly alike every time. Entries are keyed by the
+    network's hash and the track and hold the step limit they were
+    evaluated with. A car that stopped before the limit has its final
+    fitness, which is also the fitness for any longer limit, so it is reused
+    as the limit grows. Cars that drove until the limit are driven again.
+    The least recently used entries are evicted.
+
+    Attributes:
+    - capacity (int): The maximum number of entries.
+    - hits, misses (int): Counters of the lookups.
+
+    Methods:
+    - get(key, step_limit): Return the fitness and the steps driven of the
+        key at the step limit, or None.
+
+    - put(key, step_limit, fitness, steps): Store an evaluation.
+
+    - hit_rate(): Return the fraction of lookups that were hits.
+    """
+
+    def __init__(self, capacity=cf.FITNESS_CACHE_SIZE):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, step_limit):
+        """Return the cached evaluation of the key if it holds at the step limit.
+
+        Args:
+            key (tuple): The hash of the network and the key of the track.
+            step_limit (int): The maximum number of steps of the evaluation.
+
+        Returns:
+            tuple: The fitness and the number of steps the car drove, or None.
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            limit, fitness, steps = entry
+            if limit == step_limit or steps < limit <= step_limit:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return fitness, steps
+        self.misses += 1
+        return None
+
+    def put(self, key, step_limit, fitness, steps):
+        self.entries[key] = (step_limit, fitness, steps)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def _evaluate_chunk(track_index, networks, step_limit):
+    return simulate(networks, _worker_tracks[track_index], step_limit)
+
+
+class ParallelEvaluator:
+    """
+    Evaluates the fitness of a generation's networks in a process pool.
+
+    The cars of a generation do not interact, so the networks are split
+    into chunks that are simulated in separate processes, and the chunks of
+    all tracks run concurrently. The tracks are put in shared memory once,
+    each worker attaches to them when it starts, and only the fitness
+    values are sent back. Sensor tables are memory-mapped from their files
+    by every worker. The results do not depend on the number of
+    workers.
+
+    Attributes:
+    - workers (int): The number of worker processes.
+
+    Methods:
+    - evaluate(networks, step_limit): Return the fitness of every network
+        and the steps its car drove on every track.
+
+    - close(): Shut down the workers and free the shared tracks.
+    """
+
+    def __init__(self, tracks, workers=cf.WORKERS):
+        self.workers = workers
+        self.shared = [(SharedArray(track.road), SharedArray(track.field.field),
+                        SharedArray(track.progress.progress)) for track in tracks]
+        initargs = [(*shared, track.start, track.table) for shared, track in zip(self.shared, tracks)]
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                        initargs=(initargs,))
+
+    def evaluate(self, networks, step_limit):
+        """Simulate the networks in the worker processes.
+
+        Args:
+            networks (list): The neural networks to evaluate.
+            step_limit (int): The maximum number of steps.
+
+        Returns:
+            tuple: The fitness of every network and the number of steps its
+                car drove, one list of each per track.
+        """
+        num_tracks = len(self.shared)
+        num_chunks = min(len(networks), -(-self.workers * cf.CHUNKS_PER_WORKER // num_tracks))
+        bounds = np.linspace(0, len(networks), num_chunks + 1).astype(int).tolist()
+        chunks = [networks[start:end] for start, end in zip(bounds, bounds[1:])]
+        track_indices = [i for i in range(num_tracks) for _ in chunks]
+        results = self.pool.map(_evaluate_chunk, track_indices, chunks * num_tracks,
+                                [step_limit] * len(track_indices))
+        fitnesses, ages = [[] for _ in range(num_tracks)], [[] for _ in range(num_tracks)]
+        for i, (chunk_fitnesses, chunk_ages) in zip(track_indices, results):
+            fitnesses[i] += chunk_fitnesses
+            ages[i] += chunk_ages
+        return fitnesses, ages
+
+    def close(self):
+        self.pool.shutdown()
+        for track in self.shared:
+            for shared in track:
+                shared.close()
@@ -0,0 +1,133 @@
+import multiprocessing as mp
+import random as rnd
+
+import config as cf
+from simulation import Simulation
+from track import Track
+
+
+def get_neighbours(index, islands, topology=cf.MIGRATION_TOPOLOGY):
+    """Return the islands an island sends its migrants to.
+
+    Args:
+        index (int): The index of the island.
+        islands (int): The number of islands.
+        topology (str): "ring" to send to the next island, or "complete" to
+            send to every other island.
+
+    Returns:
+        list: The indices of the neighbouring islands.
+    """
+    if topology == "ring":
+        return [(index + 1) % islands] if islands > 1 else []
+    if topology == "complete":
+        return [i for i in range(islands) if i != index]
+    raise Exception(f"Unknown migration topology: {topology}.")
+
+
+def _run_island(connection, seed, track_paths):
+    """Evolve a population in a worker process, driven by the messages of
+    the IslandModel: (generations, migrate) to run generations, None to stop.
+    """
+    rnd.seed(seed)
+    # The islands would overwrite each other's checkpoints and statistics:
+    cf.CHECKPOINT_PATH = None
+    cf.STATS_PATH = None
+    sim = Simulation(track_paths=track_paths, workers=1)
+    try:
+        while True:
+            message = connection.recv()
+            if message is None:
+                break
+            generations, migrate = message
+            stats = []
+            for generation in range(generations):
+                number = sim.neat.generation
+                sim.evaluate_generation()
+                if migrate and generation == generations - 1:
+                    connection.send(sim.neat.get_migrants(cf.MIGRANTS))
+                    sim.neat.immigrate(connection.recv())
+                sim.evolve()
+                # The same statistics as a single headless population reports:
+                stats.append((number, sim.stats.best, len(sim.neat.population)))
+            connection.send(stats)
+    finally:
+        sim.close()
+
+
+class IslandModel:
+    """
+    Represents several NEAT populations evolving in separate processes.
+
+    Every island evolves on its own, headless and in lockstep with the
+    others. Every cf.MIGRATION_INTERVAL generations, after the generation is
+    evaluated and before it evolves, each island sends copies of its
+    cf.MIGRANTS fittest networks to its neighbours in the topology, where
+    they replace the least fit networks and are speciated. The islands are
+    seeded from the random number generator of the main process, so seeding
+    it makes a run reproducible.
+
+    Attributes:
+    - islands (int): The number of islands.
+    - neighbours (list): The islands every island sends its migrants to.
+    - generations (int): The number of generations evolved so far.
+
+    Methods:
+    - run(generations): Evolve every island, yielding the statistics of
+        every generation.
+
+    - close(): Stop the island processes.
+    """
+
+    def __init__(self, islands=cf.ISLANDS, track_paths=cf.TRACK_IMAGES, topology=cf.MIGRATION_TOPOLOGY):
+        self.islands = islands
+        self.neighbours = [get_neighbours(i, islands, topology) for i in range(islands)]
+        self.generations = 0
+        # Preprocess the tracks once here, the islands load them from the cache:
+        for path in track_paths:
+            Track(path)
+
+        self.connections, self.processes = [], []
+        for _ in range(islands):
+            connection, island_connection = mp.Pipe()
+            process = mp.Process(target=_run_island, daemon=True,
+                                 args=(island_connection, rnd.randrange(2**32), track_paths))
+            process.start()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def run(self, generations):
+        """Evolve every island for the given number of generations,
+        migrating every cf.MIGRATION_INTERVAL generations.
+
+        Args:
+            generations (int): The number of generations to run.
+
+        Yields:
+            list: The generation, the highest fitness per second so far and
+                the number of species of every island, once per generation.
+        """
+        while generations > 0:
+            count = min(generations, cf.MIGRATION_INTERVAL - self.generations % cf.MIGRATION_INTERVAL)
+            migrate = self.islands > 1 and (self.generations + count) % cf.MIGRATION_INTERVAL == 0
+            for connection in self.connections:
+                connection.send((count, migrate))
+            if migrate:
+                emigrants = [connection.recv() for connection in self.connections]
+                arrivals = [[] for _ in range(self.islands)]
+                for migrants, neighbours in zip(emigrants, self.neighbours):
+                    for i in neighbours:
+                        arrivals[i] += migrants
+                for connection, migrants in zip(self.connections, arrivals):
+                    migrants.sort(key=lambda nn: nn.fitness, reverse=True)
+                    connection.send(migrants)
+            results = [connection.recv() for connection in self.connections]
+            yield from (list(stats) for stats in zip(*results))
+            self.generations += count
+            generations -= count
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(None)
+        for process in self.processes:
+            process.join()
@@ -1,9 +1,57 @@
 from enum import Enum
+import hashlib
+import json
 import math
 import random as rnd
-import copy
+import numpy as np
 
 import config as cf
+from atomic import atomic_write
+
+# Global innovation numbers of the edges, structurally equal edges of
+# different networks share the same number:
+innovations = {}
+
+# Identifier of the next species founded, unique within an evolution:
+next_species_id = 0
+
+# Checkpoint files start with the magic bytes and the format version:
+CHECKPOINT_MAGIC = b"NEATCKPT"
+CHECKPOINT_VERSION = 1
+CHECKPOINT_ALIGNMENT = 64
+
+# Species the new individuals are compared with at once when speciating:
+SPECIATION_BLOCK = 32
+# Individuals compared at once, bounding the temporary arrays of a comparison:
+SPECIATION_ROWS = 256
+
+
+def get_innovation(from_node, to_node):
+    """Return the innovation number of the edge between the given nodes,
+    assigning the next free number to edges that have not been seen before.
+
+    Args:
+        from_node (int): An identifier of the node in which the edge starts.
+        to_node (int): An identifier of the node in which the edge ends.
+
+    Returns:
+        int: The innovation number of the edge.
+    """
+    key = (from_node, to_node)
+    if key not in innovations:
+        innovations[key] = len(innovations)
+    return innovations[key]
+
+
+def new_species_id():
+    """Return a new identifier for a species.
+
+    Returns:
+        int: The identifier, increasing in the order species are founded.
+    """
+    global next_species_id
+    next_species_id += 1
+    return next_species_id - 1
 
 
 class Layer(Enum):
@@ -26,36 +74,102 @@ class Species:
     providing attributes and methods to simplify the representation.
 
     Attributes:
+    - id (int): The identifier of the species, stable for its lifetime.
     - members (list): A list of all the neural networks in this species.
     - color (tuple): A tuple representing the RGBA color of the species.
+    - best (NeuralNetwork): The fittest member, or None until it is looked up.
+    - worst (NeuralNetwork): The least fit member, or None until it is looked up.
+    - positions (dict): The position of every member in the list of members.
 
     Methods:
     - add(member): Add the member to the list of members.
 
     - remove(member): Remove the member from the list of members.
 
+    - keep(count): Keep only the given number of fittest members.
+
+    - clear_cache(): Forget the fittest and least fit members after the
+        fitnesses of the members changed.
+
     - get_representative(): Return the member to represent the species 
     when determing similarity between another individual and this species.
+
+    - get_worst(): Return the least fit member.
     """
 
     def __init__(self, members=None):
+        self.id = new_species_id()
         self.members = members if members else []
+        self.positions = {member: i for i, member in enumerate(self.members)}
         self.color = (rnd.choices(range(255), k=4))
+        self.best = None
+        self.worst = None
 
     def add(self, member):
+        self.positions[member] = len(self.members)
         self.members.append(member)
+        if self.best is not None and member.fitness > self.best.fitness:
+            self.best = member
+        if self.worst is not None and member.fitness < self.worst.fitness:
+            self.worst = member
 
     def remove(self, member):
-        self.members.remove(member)
+        """Remove the member in constant time by moving the last member
+        into its position.
+
+        Args:
+            member (NeuralNetwork): The member to remove.
+        """
+        position = self.positions.pop(member)
+        last = self.members.pop()
+        if last is not member:
+            self.members[position] = last
+            self.positions[last] = position
+        if member is self.best:
+            self.best = None
+        if member is self.worst:
+            self.worst = None
+
+    def keep(self, count):
+        """Keep only the given number of fittest members.
+
+        Args:
+            count (int): The number of members to keep.
+        """
+        self.members.sort(key=lambda m: m.fitness, reverse=True)
+        self.members = self.members[:count]
+        self.positions = {member: i for i, member in enumerate(self.members)}
+        self.best = self.members[0] if self.members else None
+        self.worst = self.members[-1] if self.members else None
+
+    def clear_cache(self):
+        self.best = None
+        self.worst = None
 
     def get_representative(self):
         """Return the member to represent the species when determing 
         similarity between another individual and this species.
 
+        The fittest member is cached until the fitnesses change, when
+        clear_cache() forgets it, and keep() refreshes it when the
+        survivors are selected.
+
         Returns:
             NeuralNetwork: The neural network to represent this species.
         """
-        return max(self.members, key=lambda m: m.fitness)
+        if self.best is None:
+            self.best = max(self.members, key=lambda m: m.fitness)
+        return self.best
+
+    def get_worst(self):
+        """Return the least fit member, cached like the representative.
+
+        Returns:
+            NeuralNetwork: The neural network with the lowest fitness.
+        """
+        if self.worst is None:
+            self.worst = min(self.members, key=lambda m: m.fitness)
+        return self.worst
 
 
 class Node:
@@ -68,18 +182,23 @@ class Node:
     Attributes:
     - id (int): An integer representing the Node identifier.
     - type (Layer): A Layer representing the Node's layer.
-    - value (float): A temporary value for the Node during feed forward.
     - bias (float): The Node's bias parameter.
+
+    Methods:
+    - copy(): Return a copy of the node.
     """
+    __slots__ = ("id", "type", "bias")
 
-    def __init__(self, id, type=Layer.HIDDEN, bias=rnd.uniform(-1, 1)):
+    def __init__(self, id, type=Layer.HIDDEN, bias=None):
         self.id = id
         self.type = type
-        self.value = 0
-        self.bias = bias
+        self.bias = bias if bias is not None else rnd.uniform(-1, 1)
+
+    def copy(self):
+        return Node(self.id, self.type, self.bias)
 
     def __deepcopy__(self, memo):
-        return self.__class__(self.id, self.type, self.bias)
+        return self.copy()
 
 
 class Edge:
@@ -94,16 +213,191 @@ class Edge:
     - to_node (int): An identifier of the node in which the edge ends.
     - weight (float): The weight of the edge.
     - enabled (bool): A boolean representing whether or not the edge is enabled.
+    - innovation (int): The global innovation number of the edge.
+
+    Methods:
+    - copy(): Return a copy of the edge.
     """
+    __slots__ = ("from_node", "to_node", "weight", "enabled", "innovation")
 
-    def __init__(self, from_node, to_node, weight, enabled=True):
+    def __init__(self, from_node, to_node, weight, enabled=True, innovation=None):
         self.from_node = from_node
         self.to_node = to_node
         self.weight = weight
         self.enabled = enabled
+        self.innovation = innovation if innovation is not None else get_innovation(from_node, to_node)
+
+    def copy(self):
+        return Edge(self.from_node, self.to_node, self.weight, self.enabled, self.innovation)
 
     def __deepcopy__(self, memo):
-        return self.__class__(self.from_node, self.to_node, self.weight, self.enabled)
+        return self.copy()
+
+
+class CompiledNetwork:
+    """
+    Represents a neural network lowered into flat arrays.
+
+    Nodes are numbered by their position in the network's node dictionary
+    and the enabled edges are kept in the order of the edge dictionary, so
+    a forward pass gives exactly the same result as iterating the dictionaries.
+
+    Attributes:
+    - index (dict): A dictionary mapping node IDs to positions in the arrays.
+    - biases (list): The bias of each node.
+    - sources (list): The position of the start node of each enabled edge.
+    - targets (list): The position of the end node of each enabled edge.
+    - weights (list): The weight of each enabled edge.
+    - inputs (list): The positions of the input nodes.
+    - outputs (list): The positions of the output nodes.
+    - edge_index (dict): A dictionary mapping edge keys to positions in the edge arrays.
+
+    Methods:
+    - feed_forward(inputs): Return the result of a forward pass in the network.
+    """
+
+    def __init__(self, nn):
+        self.index = {node_id: i for i, node_id in enumerate(nn.nodes)}
+        self.biases = [node.bias for node in nn.nodes.values()]
+        self.inputs = [self.index[id] for id, node in nn.nodes.items() if node.type == Layer.INPUT]
+        self.outputs = [self.index[id] for id, node in nn.nodes.items() if node.type == Layer.OUTPUT]
+        self.sources, self.targets, self.weights = [], [], []
+        self.edge_index = {}
+        for key, edge in nn.edges.items():
+            if edge.enabled:
+                self.edge_index[key] = len(self.weights)
+                self.sources.append(self.index[edge.from_node])
+                self.targets.append(self.index[edge.to_node])
+                self.weights.append(edge.weight)
+
+    def feed_forward(self, inputs):
+        """Perform a forward pass in the network and return the result.
+
+        Args:
+            inputs (list): List of the new input values to the input layer.
+
+        Returns:
+            list: List of output values that are the results of the forward pass.
+        """
+        values = self.biases.copy()
+        for i, input_value in zip(self.inputs, inputs):
+            values[i] += input_value
+
+        for from_node, to_node, weight in zip(self.sources, self.targets, self.weights):
+            values[to_node] += values[from_node] * weight
+
+        return [values[i] for i in self.outputs]
+
+
+class NetworkBatch:
+    """
+    Represents the neural networks of a whole population packed together.
+
+    The compiled networks are padded to the same number of nodes and their
+    edges are grouped into stages. The edges of a stage do not read a node
+    written earlier in the same stage, so each stage is evaluated for all
+    networks at once, and the results equal those of feed_forward.
+
+    Attributes:
+    - size (int): The number of networks in the batch.
+    - plans (list): The compiled network of every row.
+    - biases (numpy.ndarray): The node biases of every network, one row each.
+    - input_rows, inputs (numpy.ndarray): Row and position of every input node.
+    - output_rows, outputs (numpy.ndarray): Row and position of every output node.
+    - stages (list): Tuples of rows, sources, targets and weights of each stage's edges.
+
+    Methods:
+    - feed_forward(inputs): Return the results of forward passes in all networks.
+
+    - replace(rows, networks): Replace the networks of some rows.
+    """
+
+    def __init__(self, networks):
+        self.plans = [nn.plan if nn.plan else nn.compile() for nn in networks]
+        self.size = len(self.plans)
+        self.pack_nodes()
+        self.stages = self.group_stages(range(self.size))
+
+    def pack_nodes(self):
+        """Pack the biases, inputs and outputs of every row's network."""
+        plans = self.plans
+        num_nodes = max((len(plan.biases) for plan in plans), default=0)
+        self.biases = np.zeros((self.size, num_nodes))
+        for row, plan in enumerate(plans):
+            self.biases[row, :len(plan.biases)] = plan.biases
+        self.input_rows = np.repeat(np.arange(self.size), [len(plan.inputs) for plan in plans])
+        self.inputs = np.array([i for plan in plans for i in plan.inputs], dtype=int)
+        self.output_rows = np.repeat(np.arange(self.size), [len(plan.outputs) for plan in plans])
+        self.outputs = np.array([i for plan in plans for i in plan.outputs], dtype=int)
+
+    def group_stages(self, rows):
+        """Group the edges of the networks of the given rows into stages.
+
+        Args:
+            rows (iterable): The rows of the networks.
+
+        Returns:
+            list: Tuples of rows, sources, targets and weights of each stage's edges.
+        """
+        stages = []
+        for row in rows:
+            plan = self.plans[row]
+            stage, written = 0, set()
+            for from_node, to_node, weight in zip(plan.sources, plan.targets, plan.weights):
+                if from_node in written:
+                    stage, written = stage + 1, set()
+                written.add(to_node)
+                if stage == len(stages):
+                    stages.append(([], [], [], []))
+                for values, value in zip(stages[stage], (row, from_node, to_node, weight)):
+                    values.append(value)
+        return [(np.array(rows, dtype=int), np.array(sources, dtype=int),
+                 np.array(targets, dtype=int), np.array(weights, dtype=float))
+                for rows, sources, targets, weights in stages]
+
+    def replace(self, rows, networks):
+        """Replace the networks of the given rows. Only the edges of the new
+        networks are grouped into stages, the edges of the other rows keep
+        their stages and order, so the results still equal feed_forward.
+
+        Args:
+            rows (list): The rows to replace.
+            networks (list): The new neural network of each row.
+        """
+        for row, nn in zip(rows, networks):
+            self.plans[row] = nn.plan if nn.plan else nn.compile()
+        self.pack_nodes()
+        replaced = np.zeros(self.size, dtype=bool)
+        replaced[rows] = True
+        new_stages = self.group_stages(rows)
+        stages = []
+        for i in range(max(len(self.stages), len(new_stages))):
+            parts = []
+            if i < len(self.stages):
+                keep = ~replaced[self.stages[i][0]]
+                parts.append([values[keep] for values in self.stages[i]])
+            if i < len(new_stages):
+                parts.append(new_stages[i])
+            stage = tuple(np.concatenate(values) for values in zip(*parts))
+            # Stages left empty are dropped, which keeps the order of every row's stages:
+            if len(stage[0]):
+                stages.append(stage)
+        self.stages = stages
+
+    def feed_forward(self, inputs):
+        """Perform a forward pass in every network and return the results.
+
+        Args:
+            inputs (numpy.ndarray): The input values of each network, one row each.
+
+        Returns:
+            numpy.ndarray: The output values of each network, one row each.
+        """
+        values = self.biases.copy()
+        values[self.input_rows, self.inputs] += np.asarray(inputs, dtype=float).ravel()
+        for rows, sources, targets, weights in self.stages:
+            np.add.at(values, (rows, targets), values[rows, sources] * weights)
+        return values[self.output_rows, self.outputs].reshape(self.size, -1)
 
 
 class NeuralNetwork:
@@ -117,10 +411,18 @@ class NeuralNetwork:
     - edges (dict): A dictionary mapping start and end node IDs to an edge.
     - fitness (float): The fitness of the individual of this neural network.
     - layer_size (bool): A list where index i represents the size of layer i.
+    - plan (CompiledNetwork): The network lowered for forward passes, None
+        until the first forward pass and after structural mutations.
 
     Methods:
     - feed_forward(inputs): Return the result of a forward pass in the network.
 
+    - compile(): Lower the network into a CompiledNetwork and return it.
+
+    - copy(): Return a copy of the network with the same fitness.
+
+    - get_hash(): Return a hash of the structure and parameters of the network.
+
     - mutate(): Mutate the neural network with the assigned probabilities.
 
     - add_node(): Add a Node to the neural network in the middle of an existing Edge
@@ -136,6 +438,7 @@ class NeuralNetwork:
         self.edges = {}
         self.fitness = 0
         self.layer_size = [num_inputs, 0, num_outputs]
+        self.plan = None
 
         # Initialize input nodes:
         for i in range(num_inputs):
@@ -164,7 +467,7 @@ class NeuralNetwork:
             info += f"  Node ID: {node_id}, Type: {node.type} Bias: {node.bias}\n"
         info += "Edges:\n"
         for (from_node, to_node), edge in self.edges.items():
-            info += f"  From Node: {from_node}, To Node: {to_node}, Weight: {edge.weight}, Enabled: {edge.enabled}\n"
+            info += f"  From Node: {from_node}, To Node: {to_node}, Weight: {edge.weight}, Enabled: {edge.enabled}, Innovation: {edge.innovation}\n"
         return info
 
     def feed_forward(self, inputs):
@@ -176,20 +479,39 @@ class NeuralNetwork:
         Returns:
             list: List of output values that are the results of the forward pass.
         """
-        values = {node_id: node.bias for node_id, node in self.nodes.items()}
+        plan = self.plan if self.plan else self.compile()
+        return plan.feed_forward(inputs)
 
-        for input_id, input_value in enumerate(inputs):
-            values[input_id] += input_value
+    def compile(self):
+        """Lower the network into flat arrays for fast forward passes.
 
-        for _, edge in self.edges.items():
-            if edge.enabled:
-                from_node_id = edge.from_node
-                to_node_id = edge.to_node
-                weight = edge.weight
-                weighted_sum = values[from_node_id] * weight
-                values[to_node_id] += weighted_sum
+        Returns:
+            CompiledNetwork: The compiled network, also stored in self.plan.
+        """
+        self.plan = CompiledNetwork(self)
+        return self.plan
+
+    def copy(self):
+        nn = NeuralNetwork(0, 0)
+        nn.nodes = {node_id: node.copy() for node_id, node in self.nodes.items()}
+        nn.edges = {id: edge.copy() for id, edge in self.edges.items()}
+        nn.layer_size = list(self.layer_size)
+        nn.fitness = self.fitness
+        return nn
 
-        return (values[id] for id in self.nodes if self.nodes[id].type == Layer.OUTPUT)
+    def get_hash(self):
+        """Return a hash of the structure and parameters of the network.
+
+        Networks with the same hash have the same nodes and edges in the same
+        order, so they drive exactly alike. The hash is computed on every call,
+        as mutations change the network in place.
+
+        Returns:
+            str: The hexadecimal digest.
+        """
+        genome = ([(id, node.type.value, node.bias) for id, node in self.nodes.items()],
+                  [(key, edge.weight, edge.enabled) for key, edge in self.edges.items()])
+        return hashlib.blake2b(repr(genome).encode(), digest_size=16).hexdigest()
 
     def mutate(self):
         """Mutate the neural network with the assigned probabilities.
@@ -225,6 +547,7 @@ class NeuralNetwork:
             self.layer_size[Layer.HIDDEN.value] += 1
             self.edges[(edge.from_node, new_node_id)] = new_edge1
             self.edges[(new_node_id, edge.to_node)] = new_edge2
+            self.plan = None
 
     def add_edge(self):
         """Add an edge between two randomly chosen nodes in the network."""
@@ -244,6 +567,7 @@ class NeuralNetwork:
         if (from_node, to_node) not in self.edges and from_node != to_node:
             new_edge = Edge(from_node, to_node, rnd.uniform(-1, 1))
             self.edges[(from_node, to_node)] = new_edge
+            self.plan = None
 
     def update_param(self):
         """Update a random parameter in the neural network, 
@@ -251,11 +575,219 @@ class NeuralNetwork:
         """
         param_type = rnd.choice(["weight", "bias"])
         if param_type == "weight" and self.edges:
-            edge_to_update = rnd.choice(list(self.edges.values()))
+            key = rnd.choice(list(self.edges))
+            edge_to_update = self.edges[key]
             edge_to_update.weight += rnd.gauss(0, 1)
+            if self.plan and key in self.plan.edge_index:
+                self.plan.weights[self.plan.edge_index[key]] = edge_to_update.weight
         if param_type == "bias" and self.nodes:
             node_to_update = rnd.choice(list(self.nodes.values()))
             node_to_update.bias += rnd.gauss(0, 1)
+            if self.plan:
+                self.plan.biases[self.plan.index[node_to_update.id]] = node_to_update.bias
+
+
+def align(offset):
+    """Round the offset up to a multiple of CHECKPOINT_ALIGNMENT."""
+    return -(-offset // CHECKPOINT_ALIGNMENT) * CHECKPOINT_ALIGNMENT
+
+
+def write_checkpoint(path, header, arrays):
+    """Write a header and named arrays to a checkpoint file.
+
+    The file holds the magic bytes, the header length, a JSON header
+    describing the arrays and then the raw arrays at aligned offsets, so it
+    can be memory-mapped and read without pickle.
+
+    Args:
+        path (str): The path of the checkpoint file.
+        header (dict): JSON serializable information to store.
+        arrays (dict): The arrays to store by name.
+    """
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        layout[name] = [array.dtype.str, list(array.shape), offset]
+        offset = align(offset + array.nbytes)
+    header = dict(header, version=CHECKPOINT_VERSION, arrays=layout)
+    encoded = json.dumps(header).encode()
+    prefix = CHECKPOINT_MAGIC + np.array(len(encoded), dtype="<u8").tobytes() + encoded
+    start = align(len(prefix))
+
+    with atomic_write(path) as temporary, open(temporary, "wb") as file:
+        file.write(prefix)
+        for name, array in arrays.items():
+            file.seek(start + layout[name][2])
+            file.write(np.ascontiguousarray(array).tobytes())
+        file.truncate(start + offset)
+
+
+def read_checkpoint(path):
+    """Memory-map a checkpoint file written by write_checkpoint.
+
+    Args:
+        path (str): The path of the checkpoint file.
+
+    Returns:
+        tuple: The header and a dictionary of read-only arrays by name.
+    """
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    magic_size = len(CHECKPOINT_MAGIC)
+    if bytes(data[:magic_size]) != CHECKPOINT_MAGIC:
+        raise Exception(f"{path} is not a NEAT checkpoint.")
+    header_size = int(data[magic_size:magic_size+8].view("<u8")[0])
+    header_start = magic_size + 8
+    header = json.loads(bytes(data[header_start:header_start+header_size]))
+    if header["version"] != CHECKPOINT_VERSION:
+        raise Exception(f"Unsupported checkpoint version {header['version']}.")
+    start = align(header_start + header_size)
+    arrays = {}
+    for name, (dtype, shape, offset) in header["arrays"].items():
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape)) * dtype.itemsize
+        begin = start + offset
+        arrays[name] = data[begin:begin+size].view(dtype).reshape(shape)
+    return header, arrays
+
+
+def build_network(nodes, edges, layer_size, fitness, registry=None):
+    """Create a neural network from its stored nodes and edges.
+
+    Args:
+        nodes (tuple): Lists of the node ids, layer values and biases.
+        edges (tuple): Lists of the edge start and end nodes, weights and
+            enabled flags.
+        layer_size (list): The size of each layer.
+        fitness (float): The fitness of the network.
+        registry (dict): The innovation numbers of the edges by key, or None
+            to take them from the global innovation numbers.
+
+    Returns:
+        NeuralNetwork: The neural network.
+    """
+    nn = NeuralNetwork(0, 0)
+    for id, type, bias in zip(*nodes):
+        nn.nodes[id] = Node(id, Layer(type), bias)
+    for from_node, to_node, weight, enabled in zip(*edges):
+        innovation = registry[(from_node, to_node)] if registry is not None else None
+        nn.edges[(from_node, to_node)] = Edge(from_node, to_node, weight, bool(enabled), innovation)
+    nn.layer_size = layer_size
+    nn.fitness = fitness
+    return nn
+
+
+def get_genes(networks):
+    """Return the innovation numbers and weights of the edges of all the
+    networks one after another, and the number of edges of each network.
+
+    Args:
+        networks (list): The neural networks.
+
+    Returns:
+        tuple: The innovation numbers, the weights and the numbers of edges
+            as NumPy arrays.
+    """
+    innovations, weights = [], []
+    for nn in networks:
+        for edge in nn.edges.values():
+            innovations.append(edge.innovation)
+            weights.append(edge.weight)
+    lengths = np.fromiter((len(nn.edges) for nn in networks), dtype=np.int64, count=len(networks))
+    return np.array(innovations, dtype=np.int64), np.array(weights, dtype=np.float64), lengths
+
+
+class GeneMatrix:
+    """
+    Represents the edges of many neural networks scattered into a matrix
+    with a row per network and a column per innovation number, to compute
+    their genetic differences to another network at once.
+
+    A representative is compared with all rows by gathering the columns of
+    its edges. The number of each row's edges at or beyond every column is
+    counted once, which gives the excess edges beyond the representative's
+    highest innovation number without looking at the edges again.
+
+    Attributes:
+    - columns (numpy.ndarray): The innovation number of each column, ascending,
+        starting with an empty column of innovation number -1.
+    - present (numpy.ndarray): Boolean array indexed [row, column], True
+        where the network has the edge.
+    - weights (numpy.ndarray): The weights of the edges, 0 where missing.
+    - lengths (numpy.ndarray): The number of edges of each network.
+    - max_innovations (numpy.ndarray): The highest innovation number of
+        each network, -1 without edges.
+    - beyond (numpy.ndarray): The number of edges of each row at or beyond
+        each column, with a last column of zeros.
+
+    Methods:
+    - genetic_differences(networks, rows): Return the genetic differences
+        between the networks of the rows and the given networks.
+    """
+
+    def __init__(self, networks):
+        innovations, weights, self.lengths = get_genes(networks)
+        # The first column holds no edges and stands for the padding of edge lists:
+        self.columns = np.unique(np.append(innovations, -1))
+
+        rows = np.repeat(np.arange(len(networks)), self.lengths)
+        columns = np.searchsorted(self.columns, innovations)
+        self.present = np.zeros((len(networks), len(self.columns)), dtype=bool)
+        self.present[rows, columns] = True
+        self.weights = np.zeros((len(networks), len(self.columns)))
+        self.weights[rows, columns] = weights
+        self.beyond = np.zeros((len(networks), len(self.columns) + 1), dtype=np.int64)
+        self.beyond[:, :-1] = np.cumsum(self.present[:, ::-1], axis=1)[:, ::-1]
+        # The last column with edges, or the empty first column:
+        self.max_innovations = self.columns[np.maximum((self.beyond[:, :-1] > 0).sum(axis=1) - 1, 0)]
+
+    def genetic_differences(self, networks, rows):
+        """Return the genetic differences between the networks of the rows
+        and the given networks, equal to NEAT.genetic_difference(). The rows
+        are compared SPECIATION_ROWS at a time to bound the memory used.
+
+        Args:
+            networks (list): The neural networks to compare with.
+            rows (numpy.ndarray): The rows of the networks to compare.
+
+        Returns:
+            numpy.ndarray: The compatibility distances, indexed [row, network].
+        """
+        # The edges of the networks padded to the same length:
+        flat_innovations, flat_weights, lengths = get_genes(networks)
+        rows_of_edges = np.repeat(np.arange(len(networks)), lengths)
+        positions = np.arange(len(flat_innovations)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        innovations = np.full((len(networks), max(lengths, default=0)), -1, dtype=np.int64)
+        innovations[rows_of_edges, positions] = flat_innovations
+        weights = np.zeros(innovations.shape)
+        weights[rows_of_edges, positions] = flat_weights
+        max_innovations = innovations.max(axis=1, initial=-1)
+
+        # Edges that no row has are never matching, padding finds the empty first column:
+        columns = np.minimum(np.searchsorted(self.columns, innovations), len(self.columns) - 1)
+        known = self.columns[columns] == innovations
+        beyond_columns = np.searchsorted(self.columns, max_innovations, side="right")
+
+        differences = np.empty((len(rows), len(networks)))
+        for start in range(0, len(rows), SPECIATION_ROWS):
+            chunk = rows[start:start + SPECIATION_ROWS]
+            index = chunk[:, None, None], columns[None]
+            matching = self.present[index] & known
+            matching_edges = matching.sum(axis=2)
+            weight_difference = (np.abs(self.weights[index] - weights) * matching).sum(axis=2)
+            mean_weight_difference = np.divide(weight_difference, matching_edges,
+                                               out=np.zeros(matching_edges.shape), where=matching_edges > 0)
+
+            # Edges beyond the other network's highest innovation are excess:
+            row_lengths = self.lengths[chunk][:, None]
+            excess_edges = self.beyond[chunk[:, None], beyond_columns] + \
+                (innovations > self.max_innovations[chunk][:, None, None]).sum(axis=2)
+            disjoint_edges = row_lengths + lengths - 2*matching_edges - excess_edges
+            num_edges = np.maximum(np.maximum(row_lengths, lengths), 1)
+
+            c1, c2, c3 = cf.C1, cf.C2, cf.C3
+            differences[start:start + SPECIATION_ROWS] = c1 * excess_edges/num_edges + \
+                c2 * disjoint_edges/num_edges + \
+                c3 * mean_weight_difference
+        return differences
 
 
 class NEAT:
@@ -265,15 +797,27 @@ class NEAT:
     Attributes:
     - generation (int): An integer representing the current generation number.
     - population (list): A list containing all the current Species.
+    - batch (NetworkBatch): The packed networks of get_individuals(), None
+        until requested and after evolving.
 
     Methods:
     - get_individuals(): Return all the Neural Networks in the population.
 
+    - get_batch(): Return the networks of all individuals packed for batched
+        forward passes.
+
+    - compatibility(): Return the excess and disjoint edge counts and the
+        mean weight difference of matching edges of two individuals.
+
     - genetic_difference(): Return the genetic difference between two 
         individuals based on compatability distance
 
+    - find_species(): Return the species the individual is compatible with.
+
     - speciate(): Assign a species to the individual based on the genetic compability.
 
+    - speciate_all(): Assign species to many new individuals in one pass.
+
     - select(): Select the survivors of the current generation.
 
     - crossover(): Apply crossover on the given parents.
@@ -285,18 +829,96 @@ class NEAT:
         Evolve the population to a new generation by selecting the
         best performing species and offspring and replacing the others
         with neural networks similar to the well-performing ones.
+
+    - clear_species_cache(): Forget the cached members of every species
+        after the fitnesses changed.
+
+    - breed(): Return a new offspring of the population for steady-state evolution.
+
+    - insert(individual): Add an evaluated individual to the population
+        in steady-state evolution, removing the least fit one.
+
+    - get_migrants(count): Return copies of the fittest individuals.
+
+    - immigrate(migrants): Replace the least fit individuals with networks
+        from another population.
+
+    - save(path): Write the state of the evolution to a checkpoint file.
+
+    - load(path): Create a NEAT instance from a checkpoint file.
+
+    - load_champion(path): Read only the fittest network of a checkpoint file.
     """
 
-    def __init__(self):
+    def __init__(self, population=None):
         self.generation = 1
-        self.population = []
-        for _ in range(cf.POPULATION_SIZE):
-            individual = NeuralNetwork(cf.NUM_INPUTS, cf.NUM_OUTPUTS)
-            self.population.append(Species([individual]))
+        self.population = population if population is not None else []
+        self.batch = None
+        if population is None:
+            for _ in range(cf.POPULATION_SIZE):
+                individual = NeuralNetwork(cf.NUM_INPUTS, cf.NUM_OUTPUTS)
+                self.population.append(Species([individual]))
 
     def get_individuals(self):
         return [individual for species in self.population for individual in species.members]
 
+    def get_batch(self):
+        """Return the networks of all individuals packed for batched forward
+        passes. The rows follow the order of get_individuals().
+
+        Returns:
+            NetworkBatch: The packed networks, rebuilt only after evolving.
+        """
+        if self.batch is None:
+            self.batch = NetworkBatch(self.get_individuals())
+        return self.batch
+
+    def compatibility(self, nn1, nn2):
+        """Align the edges of two neural networks by their innovation numbers.
+
+        Edges are matched by their keys in the edge dictionaries, so this
+        takes time linear in the number of edges. Unmatched edges with an innovation
+        number beyond the other network's highest one are excess edges,
+        the others are disjoint edges.
+
+        Args:
+            nn1 (NeuralNetwork): The first neural network.
+            nn2 (NeuralNetwork): The second neural network.
+
+        Returns:
+            tuple: The number of excess edges, the number of disjoint edges
+                and the mean weight difference of the matching edges.
+        """
+        edges1, edges2 = nn1.edges, nn2.edges
+        matching_edges = 0
+        weight_difference = 0
+        max_matching = -1
+        unmatched1 = []
+        for id, e1 in edges1.items():
+            e2 = edges2.get(id)
+            if e2 is None:
+                unmatched1.append(e1.innovation)
+            else:
+                matching_edges += 1
+                weight_difference += abs(e1.weight - e2.weight)
+                if e1.innovation > max_matching:
+                    max_matching = e1.innovation
+        unmatched2 = []
+        if len(edges2) != matching_edges:
+            unmatched2 = [e2.innovation for id, e2 in edges2.items() if id not in edges1]
+
+        # Edges beyond the other network's highest innovation are excess:
+        excess_edges = 0
+        if unmatched1 or unmatched2:
+            max_innovation1 = max(max(unmatched1, default=-1), max_matching)
+            max_innovation2 = max(max(unmatched2, default=-1), max_matching)
+            excess_edges = sum(1 for i in unmatched1 if i > max_innovation2) + \
+                sum(1 for i in unmatched2 if i > max_innovation1)
+        disjoint_edges = len(unmatched1) + len(unmatched2) - excess_edges
+
+        mean_weight_difference = weight_difference/matching_edges if matching_edges else 0
+        return excess_edges, disjoint_edges, mean_weight_difference
+
     def genetic_difference(self, nn1, nn2):
         """Return the genetic difference between two Neural Networks based 
         on compatability distance (see O. Stanley, K. Miikkulainen Risto.
@@ -309,25 +931,7 @@ class NEAT:
         Returns:
             float: The compatibility distance between the two networks.
         """
-        disjoint_edges = 0
-        matching_edges = 0
-        weight_difference = 0
-        matched_edges_set = set()
-
-        for e1 in nn1.edges.values():
-            match_found = False
-            for e2 in nn2.edges.values():
-                if e1.from_node == e2.from_node and e1.to_node == e2.to_node:
-                    matching_edges += 1
-                    weight_difference += abs(e1.weight - e2.weight)
-                    matched_edges_set.add(e2)
-                    match_found = True
-                    break
-
-            if not match_found:
-                disjoint_edges += 1
-
-        excess_edges = len(nn2.edges) - len(matched_edges_set)
+        excess_edges, disjoint_edges, weight_difference = self.compatibility(nn1, nn2)
         num_edges = max(len(nn1.edges), len(nn2.edges), 1)
 
         c1, c2, c3 = cf.C1, cf.C2, cf.C3
@@ -338,23 +942,84 @@ class NEAT:
 
         return compatibility_distance
 
-    def speciate(self, individual):
-        """Assign a species to the individual based on the genetic compability.
+    def find_species(self, individual):
+        """Return the first species the individual is genetically compatible with.
 
         Args:
-            individual (NeuralNetwork): The neural network to assign a species to.
+            individual (NeuralNetwork): The neural network to find a species for.
+
+        Returns:
+            Species: The compatible species, or None if there is none.
         """
-        assigned_species = False
         for species in self.population:
             species_representative = species.get_representative()
             difference = self.genetic_difference(
                 individual, species_representative)
             if difference < cf.COMPATIBILITY_THRESHOLD:
-                species.add(individual)
-                assigned_species = True
+                return species
+        return None
+
+    def speciate(self, individual):
+        """Assign a species to the individual based on the genetic compability.
+
+        Args:
+            individual (NeuralNetwork): The neural network to assign a species to.
+
+        Returns:
+            Species: The species the individual was assigned to.
+        """
+        species = self.find_species(individual)
+        if species is not None:
+            species.add(individual)
+        else:
+            species = Species([individual])
+            self.population.append(species)
+        return species
+
+    def speciate_all(self, individuals):
+        """Assign species to new individuals in one pass, exactly as
+        speciate() would one after another.
+
+        New individuals have no fitness yet, so they never replace the
+        representative of a species, and the representatives are fixed
+        before the pass. The individuals are scattered into a GeneMatrix
+        once and compared with blocks of SPECIATION_BLOCK species at a time,
+        in the order of the population, until all have found one. The first
+        individual left founds a new species, which is compared with all
+        individuals after it at once, and so on.
+
+        Args:
+            individuals (list): The neural networks to assign species to.
+        """
+        matrix = GeneMatrix(individuals)
+        assigned = [None] * len(individuals)
+        remaining = np.arange(len(individuals))
+        existing = list(self.population)
+        for start in range(0, len(existing), SPECIATION_BLOCK):
+            if not remaining.size:
                 break
-        if not assigned_species:
-            self.population.append(Species([individual]))
+            block = existing[start:start + SPECIATION_BLOCK]
+            differences = matrix.genetic_differences([s.get_representative() for s in block], remaining)
+            compatible = differences < cf.COMPATIBILITY_THRESHOLD
+            found = compatible.any(axis=1)
+            for i, j in zip(remaining[found].tolist(), compatible[found].argmax(axis=1).tolist()):
+                assigned[i] = block[j]
+            remaining = remaining[~found]
+
+        while remaining.size:
+            founder, remaining = remaining[0], remaining[1:]
+            species = Species([individuals[founder]])
+            self.population.append(species)
+            differences = matrix.genetic_differences([individuals[founder]], remaining)[:, 0]
+            compatible = differences < cf.COMPATIBILITY_THRESHOLD
+            for i in remaining[compatible].tolist():
+                assigned[i] = species
+            remaining = remaining[~compatible]
+
+        # Members join in the order of the individuals, as one by one:
+        for individual, species in zip(individuals, assigned):
+            if species is not None:
+                species.add(individual)
 
     def select(self):
         """Select the survivors of the current generation."""
@@ -363,18 +1028,14 @@ class NEAT:
 
         # Try to select the best species and individuals:
         num_surviving_species = math.ceil(len(ordered)*cf.SPECIES_SURVIVAL)
+        surviving = set()
         for species in ordered[:num_surviving_species]:
-            survivors = math.ceil(len(species.members)*cf.INDIVIDUAL_SURVIVAL)
-            species.members.sort(key=lambda m: m.fitness, reverse=True)
-            species.members = species.members[:survivors]
-
-            # Remove the species if it is empty:
-            if not species.members:
-                self.population.remove(species)
+            species.keep(math.ceil(len(species.members)*cf.INDIVIDUAL_SURVIVAL))
+            if species.members:
+                surviving.add(species)
 
-        # Remove the species that did not survive:
-        for species in ordered[num_surviving_species:]:
-            self.population.remove(species)
+        # Remove the species that did not survive or are empty:
+        self.population = [species for species in self.population if species in surviving]
 
     def crossover(self, more_fit_parent, less_fit_parent):
         """Apply crossover on the given parents.
@@ -386,17 +1047,11 @@ class NEAT:
         Returns:
             NeuralNetwork: The child that was produced through crossover.
         """
-        child = NeuralNetwork(cf.NUM_INPUTS, cf.NUM_OUTPUTS)
-        for node_id, node in more_fit_parent.nodes.items():
-            child.nodes[node_id] = copy.deepcopy(node)
-        child.layer_size = copy.deepcopy(more_fit_parent.layer_size)
-
-        for id in more_fit_parent.edges:
-            if id in less_fit_parent.edges:
-                child.edges[id] = copy.deepcopy(
-                    rnd.choice([more_fit_parent.edges[id]]))
-            else:
-                child.edges[id] = copy.deepcopy(more_fit_parent.edges[id])
+        child = NeuralNetwork(0, 0)
+        child.nodes = {node_id: node.copy() for node_id, node in more_fit_parent.nodes.items()}
+        child.layer_size = list(more_fit_parent.layer_size)
+        # Edges present in both parents are inherited from the more fit one too:
+        child.edges = {id: edge.copy() for id, edge in more_fit_parent.edges.items()}
         return child
 
     def reproduce(self):
@@ -406,9 +1061,10 @@ class NEAT:
         Returns:
             list: A list of all the new offspring produced through reproduction.
         """
+        individuals = self.get_individuals()
         new_offspring = []
-        while len(self.get_individuals()) + len(new_offspring) < cf.POPULATION_SIZE:
-            p1, p2 = rnd.sample(self.get_individuals(), 2)
+        while len(individuals) + len(new_offspring) < cf.POPULATION_SIZE:
+            p1, p2 = rnd.sample(individuals, 2)
             if p2.fitness > p1.fitness:
                 p1, p2 = p2, p1
             new_offspring.append(self.crossover(p1, p2))
@@ -423,7 +1079,216 @@ class NEAT:
         new_offspring = self.reproduce()
         for nn in new_offspring:
             nn.mutate()
-            self.speciate(nn)
+        self.speciate_all(new_offspring)
         self.generation += 1
+        self.batch = None
         for nn in self.get_individuals():
             nn.fitness = 0
+        self.clear_species_cache()
+
+    def clear_species_cache(self):
+        """Forget the cached fittest and least fit member of every species,
+        after the fitnesses of the individuals were reset or written.
+        """
+        for species in self.population:
+            species.clear_cache()
+
+    def breed(self):
+        """Return a new offspring of the population as in rtNEAT: a parent
+        species is chosen with a probability proportional to its average
+        fitness, and a child of two of its members is mutated. An empty
+        population breeds a new random network.
+
+        Returns:
+            NeuralNetwork: The new offspring, not assigned to a species yet.
+        """
+        if not self.population:
+            return NeuralNetwork(cf.NUM_INPUTS, cf.NUM_OUTPUTS)
+        weights = [sum(m.fitness for m in s.members)/len(s.members) for s in self.population]
+        if sum(weights) > 0:
+            species = rnd.choices(self.population, weights=weights)[0]
+        else:
+            species = rnd.choice(self.population)
+        if len(species.members) > 1:
+            p1, p2 = rnd.sample(species.members, 2)
+        else:
+            p1 = p2 = species.members[0]
+        if p2.fitness > p1.fitness:
+            p1, p2 = p2, p1
+        child = self.crossover(p1, p2)
+        child.mutate()
+        return child
+
+    def insert(self, individual):
+        """Add an evaluated individual to the population. If the population
+        then exceeds cf.POPULATION_SIZE, the individual with the lowest
+        fitness shared by the size of its species is removed as in rtNEAT,
+        which protects small new species.
+
+        Args:
+            individual (NeuralNetwork): The evaluated neural network.
+
+        Returns:
+            Species: The species the individual was assigned to.
+        """
+        assigned = self.speciate(individual)
+        if sum(len(species.members) for species in self.population) > cf.POPULATION_SIZE:
+            # The least fit member of each species has its lowest shared fitness:
+            species = min(self.population, key=lambda s: s.get_worst().fitness/len(s.members))
+            species.remove(species.get_worst())
+            if not species.members:
+                self.population.remove(species)
+        self.batch = None
+        return assigned
+
+    def get_migrants(self, count):
+        """Return copies of the fittest individuals to send to another
+        population.
+
+        Args:
+            count (int): The number of individuals.
+
+        Returns:
+            list: The copied neural networks, fittest first.
+        """
+        individuals = sorted(self.get_individuals(), key=lambda nn: nn.fitness, reverse=True)
+        return [nn.copy() for nn in individuals[:count]]
+
+    def immigrate(self, migrants):
+        """Replace the least fit individuals with networks from another
+        population, keeping the population size.
+
+        The migrants' innovation numbers were assigned by another process,
+        so they are renumbered from the global innovation numbers here
+        before the migrants are speciated like new offspring. Their fitness
+        is kept, so they compete in the next selection. At most half of the
+        population is replaced.
+
+        Args:
+            migrants (list): The neural networks arriving, fittest first.
+        """
+        individuals = sorted(self.get_individuals(), key=lambda nn: nn.fitness)
+        migrants = migrants[:len(individuals)//2]
+        species_of = {id(nn): species for species in self.population for nn in species.members}
+        for nn in individuals[:len(migrants)]:
+            species = species_of[id(nn)]
+            species.remove(nn)
+            if not species.members:
+                self.population.remove(species)
+        # The fitnesses were written since the representatives were cached:
+        self.clear_species_cache()
+        for nn in migrants:
+            for edge in nn.edges.values():
+                edge.innovation = get_innovation(edge.from_node, edge.to_node)
+            nn.plan = None
+            self.speciate(nn)
+        self.batch = None
+
+    def save(self, path):
+        """Write the state of the evolution to a checkpoint file: the nodes
+        and edges of every network, the species, the generation, the
+        innovation numbers and the state of the random number generator.
+
+        Args:
+            path (str): The path of the checkpoint file.
+        """
+        individuals = self.get_individuals()
+        nodes = [node for nn in individuals for node in nn.nodes.values()]
+        edges = [edge for nn in individuals for edge in nn.edges.values()]
+        fitness = np.array([nn.fitness for nn in individuals], dtype="<f8")
+        rng_version, rng_state, gauss_next = rnd.getstate()
+        arrays = {
+            "species_sizes": np.array([len(s.members) for s in self.population], dtype="<i8"),
+            "species_colors": np.array([s.color for s in self.population], dtype="<i8").reshape(-1, 4),
+            "species_ids": np.array([s.id for s in self.population], dtype="<i8"),
+            "fitness": fitness,
+            "layer_sizes": np.array([nn.layer_size for nn in individuals], dtype="<i8").reshape(-1, 3),
+            "node_offsets": np.cumsum([0] + [len(nn.nodes) for nn in individuals], dtype="<i8"),
+            "edge_offsets": np.cumsum([0] + [len(nn.edges) for nn in individuals], dtype="<i8"),
+            "node_ids": np.array([node.id for node in nodes], dtype="<i8"),
+            "node_types": np.array([node.type.value for node in nodes], dtype="u1"),
+            "node_biases": np.array([node.bias for node in nodes], dtype="<f8"),
+            "edge_from": np.array([edge.from_node for edge in edges], dtype="<i8"),
+            "edge_to": np.array([edge.to_node for edge in edges], dtype="<i8"),
+            "edge_weights": np.array([edge.weight for edge in edges], dtype="<f8"),
+            "edge_enabled": np.array([edge.enabled for edge in edges], dtype="u1"),
+            "innovations": np.array(list(innovations), dtype="<i8").reshape(-1, 2),
+            "rng_state": np.array(rng_state, dtype="<u4"),
+        }
+        header = {"generation": self.generation,
+                  "next_species_id": next_species_id,
+                  "champion": int(np.argmax(fitness)) if len(fitness) else None,
+                  "rng_version": rng_version,
+                  "gauss_next": gauss_next}
+        write_checkpoint(path, header, arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Create a NEAT instance from a checkpoint file written by save().
+
+        The innovation numbers and the state of the random number generator
+        are restored too, so the evolution continues as if uninterrupted.
+
+        Args:
+            path (str): The path of the checkpoint file.
+
+        Returns:
+            NEAT: The restored NEAT instance.
+        """
+        global next_species_id
+        header, arrays = read_checkpoint(path)
+        innovations.clear()
+        for from_node, to_node in arrays["innovations"].tolist():
+            get_innovation(from_node, to_node)
+
+        node_offsets = arrays["node_offsets"].tolist()
+        edge_offsets = arrays["edge_offsets"].tolist()
+        nodes = [arrays[name].tolist() for name in ("node_ids", "node_types", "node_biases")]
+        edges = [arrays[name].tolist() for name in ("edge_from", "edge_to", "edge_weights", "edge_enabled")]
+        networks = []
+        for i, (layer_size, fitness) in enumerate(zip(arrays["layer_sizes"].tolist(), arrays["fitness"].tolist())):
+            node_slice = slice(node_offsets[i], node_offsets[i+1])
+            edge_slice = slice(edge_offsets[i], edge_offsets[i+1])
+            networks.append(build_network([column[node_slice] for column in nodes],
+                                          [column[edge_slice] for column in edges],
+                                          layer_size, fitness))
+
+        population, start = [], 0
+        for size, color in zip(arrays["species_sizes"].tolist(), arrays["species_colors"].tolist()):
+            species = Species(networks[start:start+size])
+            species.color = color
+            population.append(species)
+            start += size
+        # Checkpoints written before species had identifiers keep the new ones:
+        if "species_ids" in arrays:
+            for species, id in zip(population, arrays["species_ids"].tolist()):
+                species.id = id
+            next_species_id = header["next_species_id"]
+
+        neat = cls(population)
+        neat.generation = header["generation"]
+        rnd.setstate((header["rng_version"], tuple(arrays["rng_state"].tolist()), header["gauss_next"]))
+        return neat
+
+    @staticmethod
+    def load_champion(path):
+        """Read only the fittest network of a checkpoint file. The global
+        innovation numbers and random state are left untouched.
+
+        Args:
+            path (str): The path of the checkpoint file.
+
+        Returns:
+            NeuralNetwork: The network with the highest fitness when saved.
+        """
+        header, arrays = read_checkpoint(path)
+        i = header["champion"]
+        if i is None:
+            raise Exception(f"{path} contains no networks.")
+        node_slice = slice(*arrays["node_offsets"][i:i+2].tolist())
+        edge_slice = slice(*arrays["edge_offsets"][i:i+2].tolist())
+        nodes = [arrays[name][node_slice].tolist() for name in ("node_ids", "node_types", "node_biases")]
+        edges = [arrays[name][edge_slice].tolist() for name in ("edge_from", "edge_to", "edge_weights", "edge_enabled")]
+        # The innovation numbers of the checkpoint, by their position in its registry:
+        registry = {tuple(key): i for i, key in enumerate(arrays["innovations"].tolist())}
+        return build_network(nodes, edges, arrays["layer_sizes"][i].tolist(), arrays["fitness"][i].item(), registry)
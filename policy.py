@@ -0,0 +1,158 @@
+import os
+import sys
+import numpy as np
+
+# Version of the exported policy files, raised when their layout changes:
+POLICY_VERSION = 1
+
+
+def schedule_edges(sources, targets):
+    """Return the stage of every edge of a forward pass, in the order of the
+    edges, so all edges of a stage can be applied at once.
+
+    A forward pass adds the edges to their target nodes one after another,
+    and an edge may read a node that a later edge writes. An edge is put in
+    the earliest stage after the last write of its source and of its target,
+    and not before the last read of its target, as the reads of a stage
+    happen before its writes. Every node is then written at most once per
+    stage and reads the same values as in the sequential pass.
+
+    Args:
+        sources (list): The position of the start node of each edge.
+        targets (list): The position of the end node of each edge.
+
+    Returns:
+        list: The stage of each edge.
+    """
+    stages, written, read = [], {}, {}
+    for source, target in zip(sources, targets):
+        stage = max(written.get(source, -1) + 1, written.get(target, -1) + 1, read.get(target, 0))
+        stages.append(stage)
+        written[target] = stage
+        read[source] = max(read.get(source, 0), stage)
+    return stages
+
+
+class Policy:
+    """
+    Represents a neural network frozen into flat arrays for deployment.
+
+    Only NumPy is needed to load and run a policy. The edges are ordered by
+    stage and every stage is applied to a whole batch of sensor readings at
+    once, with the additions of feed_forward in the same order, so the
+    outputs are exactly those of the network.
+
+    Attributes:
+    - biases (numpy.ndarray): The bias of each node.
+    - inputs (numpy.ndarray): The positions of the input nodes.
+    - outputs (numpy.ndarray): The positions of the output nodes.
+    - sources, targets, weights (numpy.ndarray): The start and end node
+        positions and the weights of the enabled edges, ordered by stage.
+    - stage_offsets (numpy.ndarray): The first edge of each stage, followed
+        by the number of edges.
+
+    Methods:
+    - from_network(nn): Freeze a neural network into a policy.
+
+    - save(path): Write the policy to a file.
+
+    - load(path): Read a policy from a file.
+
+    - predict(inputs): Return the outputs of the network for a batch of inputs.
+    """
+
+    def __init__(self, biases, inputs, outputs, sources, targets, weights, stage_offsets):
+        self.biases = np.asarray(biases, dtype=np.float64)
+        self.inputs = np.asarray(inputs, dtype=np.int64)
+        self.outputs = np.asarray(outputs, dtype=np.int64)
+        self.sources = np.asarray(sources, dtype=np.int64)
+        self.targets = np.asarray(targets, dtype=np.int64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.stage_offsets = np.asarray(stage_offsets, dtype=np.int64)
+        bounds = self.stage_offsets.tolist()
+        self.stages = [(self.sources[start:end], self.targets[start:end], self.weights[start:end, None])
+                       for start, end in zip(bounds, bounds[1:])]
+
+    @staticmethod
+    def from_network(nn):
+        """Freeze the current parameters of a neural network into a policy.
+
+        Args:
+            nn (NeuralNetwork): The neural network.
+
+        Returns:
+            Policy: The frozen network.
+        """
+        plan = nn.plan if nn.plan else nn.compile()
+        stages = np.array(schedule_edges(plan.sources, plan.targets), dtype=np.int64)
+        order = np.argsort(stages, kind="stable")
+        counts = np.bincount(stages, minlength=1) if len(stages) else np.zeros(0, dtype=np.int64)
+        stage_offsets = np.concatenate(([0], np.cumsum(counts)))
+        return Policy(plan.biases, plan.inputs, plan.outputs, np.array(plan.sources, dtype=np.int64)[order],
+                      np.array(plan.targets, dtype=np.int64)[order], np.array(plan.weights)[order], stage_offsets)
+
+    def save(self, path):
+        """Write the policy to an uncompressed .npz file without pickled objects.
+
+        Args:
+            path (str): The path of the file.
+        """
+        # Write to a temporary file first so a crash never leaves a partially
+        # written policy behind.
+        temporary = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temporary, "wb") as file:
+                np.savez(file, version=np.array(POLICY_VERSION), biases=self.biases, inputs=self.inputs,
+                         outputs=self.outputs, sources=self.sources, targets=self.targets,
+                         weights=self.weights, stage_offsets=self.stage_offsets)
+            os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+    @staticmethod
+    def load(path):
+        """Read a policy written by save.
+
+        Args:
+            path (str): The path of the file.
+
+        Returns:
+            Policy: The policy.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            version = int(data["version"])
+            if version != POLICY_VERSION:
+                raise Exception(f"Unsupported policy version {version}.")
+            return Policy(data["biases"], data["inputs"], data["outputs"], data["sources"],
+                          data["targets"], data["weights"], data["stage_offsets"])
+
+    def predict(self, inputs):
+        """Perform forward passes for a batch of inputs.
+
+        Args:
+            inputs (numpy.ndarray): The sensor readings, one row per forward
+                pass, or a single row.
+
+        Returns:
+            numpy.ndarray: The outputs, one row per row of inputs.
+        """
+        inputs = np.asarray(inputs, dtype=np.float64)
+        batch = inputs.reshape(-1, len(self.inputs))
+        # Nodes are rows, so every stage reads and writes contiguous memory:
+        values = np.empty((len(self.biases), len(batch)))
+        values[:] = self.biases[:, None]
+        values[self.inputs] += batch.T
+        for sources, targets, weights in self.stages:
+            values[targets] += values[sources] * weights
+        outputs = values[self.outputs].T
+        return outputs[0] if inputs.ndim == 1 else outputs
+
+
+if __name__ == "__main__":
+    # Export the fittest network of a checkpoint: python policy.py checkpoint.neat champion.npz
+    from neat import NEAT
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python policy.py CHECKPOINT OUTPUT")
+    Policy.from_network(NEAT.load_champion(sys.argv[1])).save(sys.argv[2])
@@ -0,0 +1,318 @@
+import math
+import numpy as np
+
+import assets
+import config as cf
+from car import Car
+from profiling import profiler
+from sensors import PIXEL_MARGIN, bounding_radius, half_radius, march_ray
+
+VIEW_ANGLES = np.array(Car.VIEW_ANGLES)
+
+
+class Population:
+    """
+    Represents the state of all cars of a generation as arrays.
+
+    Every car is a row in the arrays, so one step advances all cars that
+    have not crashed with a few vectorized operations.
+
+    Attributes:
+    - networks (list): The neural network driving each car.
+    - batch (NetworkBatch): The networks packed for batched forward passes,
+        or None to run them one by one.
+    - start (tuple): The starting pose (x0, y0, start_angle) of the cars.
+    - x, y (numpy.ndarray): The position of each car's top left corner.
+    - angle (numpy.ndarray): The heading of each car in degrees.
+    - speed, steering (numpy.ndarray): The last outputs of each car.
+    - crashed (numpy.ndarray): Whether each car has crashed.
+    - fitness (numpy.ndarray): The fitness of each car.
+    - progress (numpy.ndarray): The distance each car has made along the
+        track, counted over laps and negative when driving backwards.
+    - stalled (numpy.ndarray): The steps since each car last made
+        STAGNATION_DISTANCE of progress.
+    - age (numpy.ndarray): The steps each car has driven.
+    - inputs (numpy.ndarray): The last sensor readings of each car.
+    - masks (list): The collision mask of each car at its current angle.
+    - footprints (list): The collision points of each car at its current angle.
+
+    Methods:
+    - step(track_mask, field, road, progress, table): Advance every car that
+        has not crashed.
+
+    - sense(indices, track_mask, field, table): Return the sensor readings
+        of the cars.
+
+    - update_collision(indices, track_mask, road, field): Flag the cars that
+        left the track.
+
+    - on_road(indices, road): Return whether the cars' footprints are on the road.
+
+    - update_progress(indices, progress): Track the cars' progress along the
+        track and cull the cars that stopped making any.
+
+    - update_masks(indices): Look up the cars' masks and footprints at their
+        current angles.
+
+    - respawn(indices, networks): Put new cars at the start in place of the given ones.
+
+    - write_fitness(): Copy the fitnesses to the neural networks.
+    """
+
+    def __init__(self, networks, start, batch=None):
+        n = len(networks)
+        self.start = start
+        x0, y0, self.start_angle = start
+        self.networks = networks
+        self.batch = batch
+        self.x = np.full(n, x0, dtype=float)
+        self.y = np.full(n, y0, dtype=float)
+        self.angle = np.full(n, self.start_angle, dtype=float)
+        self.speed = np.zeros(n)
+        self.steering = np.zeros(n)
+        self.crashed = np.zeros(n, dtype=bool)
+        self.fitness = np.zeros(n)
+        self.progress = np.zeros(n)
+        self.stalled = np.zeros(n, dtype=int)
+        self.last_progress = np.full(n, np.nan)
+        self.checkpoint = np.zeros(n)
+        self.age = np.zeros(n, dtype=int)
+        self.inputs = np.zeros((n, cf.NUM_INPUTS))
+
+        mask = assets.get_mask(0)
+        self.masks = [mask] * n
+        self.footprints = [assets.get_footprint(0)] * n
+        self.center = assets.get_car_image().get_rect().center
+        self.width = self.center[0]
+        self.half_radius = half_radius(mask)
+        self.radius = bounding_radius(mask) + PIXEL_MARGIN
+
+    def __len__(self):
+        return len(self.networks)
+
+    def step(self, track_mask, field=None, road=None, progress=None, table=None):
+        """Advance every car that has not crashed by one step.
+
+        Args:
+            track_mask (pygame.Mask): Pygame mask of the track.
+            field (DistanceField): Distance field of the track to cast rays
+                with, or None to march rays over the track mask.
+            road (numpy.ndarray): Boolean array of the track indexed [y, x]
+                for footprint collisions, or None to overlap the masks.
+            progress (ProgressField): Progress field of the track to measure
+                progress and cull stagnating cars with, or None to do neither.
+            table (SensorTable): Precomputed readings of the track to look
+                the rays up in, or None to cast them.
+        """
+        alive = np.flatnonzero(~self.crashed)
+        if not alive.size:
+            return
+        with profiler.phase("sensing"):
+            inputs = self.sense(alive, track_mask, field, table)
+            self.inputs[alive] = inputs
+        with profiler.phase("inference"):
+            if self.batch is not None:
+                outputs = self.batch.feed_forward(self.inputs)[alive]
+            else:
+                outputs = np.array([list(self.networks[i].feed_forward(row))
+                                    for i, row in zip(alive.tolist(), inputs.tolist())])
+
+        with profiler.phase("physics"):
+            speed = np.clip(outputs[:, 0] * cf.CAR_SPEED_MULTIPLIER, cf.CAR_MIN_SPEED, cf.CAR_MAX_SPEED)
+            steering = np.clip(outputs[:, 1] * cf.CAR_STEER_MULTIPLIER, -cf.CAR_MAX_TURN, cf.CAR_MAX_TURN)
+            radians = np.radians(self.angle[alive])
+            self.x[alive] += speed * np.cos(radians)
+            self.y[alive] += speed * -np.sin(radians)
+            self.angle[alive] += steering
+            self.speed[alive] = speed
+            self.steering[alive] = steering
+            self.age[alive] += 1
+            if cf.FITNESS == "distance":
+                self.fitness[alive] += speed
+
+        with profiler.phase("collision"):
+            self.update_collision(alive, track_mask, road, field)
+            self.update_masks(alive)
+
+        if progress is not None:
+            with profiler.phase("progress"):
+                self.update_progress(alive, progress)
+
+    def sense(self, indices, track_mask, field=None, table=None):
+        """Return the distances of the rays of the given cars until collision.
+
+        Args:
+            indices (numpy.ndarray): The indices of the cars.
+            track_mask (pygame.Mask): Pygame mask of the track.
+            field (DistanceField): Distance field of the track to cast rays
+                with, or None to march rays over the track mask.
+            table (SensorTable): Precomputed readings of the track to look
+                the rays up in, or None to cast them.
+
+        Returns:
+            numpy.ndarray: The readings of each car's rays, one row per car.
+        """
+        n, num_rays = len(indices), len(VIEW_ANGLES)
+        dx, dy = self.center
+        if table is not None:
+            profiler.count("table_lookups", n)
+            return table.lookup(self.x[indices] + dx, self.y[indices] + dy, self.angle[indices])
+        radians = np.radians(self.angle[indices, None] + VIEW_ANGLES).ravel()
+        dir_x, dir_y = np.cos(radians), -np.sin(radians)
+        x0 = np.repeat(self.x[indices] + dx, num_rays)
+        y0 = np.repeat(self.y[indices] + dy, num_rays)
+        masks = [self.masks[i] for i in indices.tolist() for _ in range(num_rays)]
+
+        if field is not None and not cf.RAY_EXACT_HIT:
+            # The rotated mask is centered on the rotated image, not on the
+            # car's center, so trace from the center of the mask instead.
+            sizes = np.array([mask.get_size() for mask in masks])
+            steps = field.trace(x0 + sizes[:, 0]/2 - dx, y0 + sizes[:, 1]/2 - dy, dir_x, dir_y)
+        else:
+            if field is not None:
+                sizes = np.array([mask.get_size() for mask in masks])
+                starts = field.skip(x0 + sizes[:, 0]/2 - dx, y0 + sizes[:, 1]/2 - dy, dir_x, dir_y,
+                                    self.half_radius + PIXEL_MARGIN).tolist()
+                stride = cf.RAY_TOLERANCE + 1
+            else:
+                starts, stride = [0] * len(masks), 1
+            steps = np.array([
+                march_ray(track_mask, mask, x, y, ux, uy, self.center, start, stride)
+                for mask, x, y, ux, uy, start in zip(masks, x0.tolist(), y0.tolist(),
+                                                      dir_x.tolist(), dir_y.tolist(), starts)])
+            if profiler.enabled:
+                profiler.count("overlap_area", int(np.sum((steps - starts) // stride)) + len(masks))
+        if profiler.enabled:
+            profiler.count("rays", len(masks))
+            profiler.count("ray_steps", int(np.sum(steps)))
+        readings = np.maximum(0, steps - math.ceil(self.width/2))
+        return readings.reshape(n, num_rays).astype(float)
+
+    def update_collision(self, indices, track_mask, road=None, field=None):
+        """Flag the given cars as crashed if they are not fully on the track.
+
+        Args:
+            indices (numpy.ndarray): The indices of the cars.
+            track_mask (pygame.Mask): Pygame mask of the track.
+            road (numpy.ndarray): Boolean array of the track indexed [y, x]
+                to test the footprints against, or None to overlap the masks.
+            field (DistanceField): Distance field of the track to skip the
+                cars far from walls with, or None to test every car.
+        """
+        if road is not None and cf.COLLISION == "footprint":
+            if field is not None:
+                # Cars farther from every wall than their radius cannot collide:
+                sizes = np.array([self.masks[i].get_size() for i in indices.tolist()]).reshape(-1, 2)
+                clearance = field.lookup(self.x[indices] + sizes[:, 0]/2, self.y[indices] + sizes[:, 1]/2)
+                indices = indices[clearance <= self.radius]
+            if len(indices):
+                if profiler.enabled:
+                    profiler.count("footprint_points", sum(self.footprints[i].shape[1] for i in indices.tolist()))
+                self.crashed[indices[~self.on_road(indices, road)]] = True
+            return
+        profiler.count("overlap_area", len(indices))
+        for i, x, y in zip(indices.tolist(), self.x[indices].tolist(), self.y[indices].tolist()):
+            mask = self.masks[i]
+            if not track_mask.overlap_area(mask, (x, y)) == mask.count():
+                self.crashed[i] = True
+
+    def on_road(self, indices, road):
+        """Test the footprint points of the given cars against the road in
+        one indexing operation. A mask placed at a float position is
+        truncated to whole pixels, so the points are too.
+
+        Args:
+            indices (numpy.ndarray): The indices of the cars.
+            road (numpy.ndarray): Boolean array of the track indexed [y, x].
+
+        Returns:
+            numpy.ndarray: Whether all points of each car are on the road.
+        """
+        footprints = [self.footprints[i] for i in indices.tolist()]
+        sizes = [points.shape[1] for points in footprints]
+        x, y = np.concatenate(footprints, axis=1)
+        x += np.repeat(self.x[indices].astype(int), sizes)
+        y += np.repeat(self.y[indices].astype(int), sizes)
+        height, width = road.shape
+        inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        if inside.all():
+            on_road = road.ravel().take(y * width + x)
+        else:
+            on_road = np.zeros(len(x), dtype=bool)
+            on_road[inside] = road[y[inside], x[inside]]
+        return np.logical_and.reduceat(on_road, np.cumsum([0] + sizes[:-1]))
+
+    def update_progress(self, indices, progress):
+        """Advance the progress of the given cars along the track and flag
+        the cars that have not made STAGNATION_DISTANCE of progress within
+        STAGNATION_STEPS as crashed, so circling or parked cars do not keep
+        the generation running.
+
+        Args:
+            indices (numpy.ndarray): The indices of the cars.
+            progress (ProgressField): Progress field of the track.
+        """
+        dx, dy = self.center
+        current = progress.lookup(self.x[indices] + dx, self.y[indices] + dy)
+        last = self.last_progress[indices]
+        # Crossing the start jumps by about a lap, which is unwrapped. Cars
+        # at their first lookup or off the field make no progress:
+        delta = current - last
+        if progress.length:
+            delta -= progress.length * np.round(delta / progress.length)
+        delta[np.isnan(delta)] = 0
+        self.progress[indices] += delta
+        self.last_progress[indices] = np.where(np.isnan(current), last, current)
+
+        if cf.FITNESS == "progress":
+            self.fitness[indices] = np.maximum(self.fitness[indices], self.progress[indices])
+
+        advanced = self.progress[indices] >= self.checkpoint[indices] + cf.STAGNATION_DISTANCE
+        self.checkpoint[indices[advanced]] = self.progress[indices[advanced]]
+        self.stalled[indices] = np.where(advanced, 0, self.stalled[indices] + 1)
+        if cf.STAGNATION_STEPS > 0:
+            culled = indices[(self.stalled[indices] >= cf.STAGNATION_STEPS) & ~self.crashed[indices]]
+            self.crashed[culled] = True
+            profiler.count("culled", len(culled))
+
+    def update_masks(self, indices):
+        """Look up the cached masks and footprints of the given cars at their
+        current angles.
+
+        Args:
+            indices (numpy.ndarray): The indices of the cars.
+        """
+        footprints = cf.COLLISION == "footprint"
+        for i, angle in zip(indices.tolist(), self.angle[indices].tolist()):
+            self.masks[i] = assets.get_mask(angle - self.start_angle)
+            if footprints:
+                self.footprints[i] = assets.get_footprint(angle - self.start_angle)
+
+    def respawn(self, indices, networks):
+        """Replace the given cars with new cars at the start, driven by the
+        given networks.
+
+        Args:
+            indices (numpy.ndarray): The indices of the cars.
+            networks (list): The neural network of each new car.
+        """
+        x0, y0, _ = self.start
+        for i, nn in zip(indices.tolist(), networks):
+            self.networks[i] = nn
+        self.x[indices], self.y[indices], self.angle[indices] = x0, y0, self.start_angle
+        for values in (self.speed, self.steering, self.fitness, self.inputs,
+                       self.progress, self.stalled, self.checkpoint, self.age):
+            values[indices] = 0
+        self.crashed[indices] = False
+        self.last_progress[indices] = np.nan
+        mask, footprint = assets.get_mask(0), assets.get_footprint(0)
+        for i in indices.tolist():
+            self.masks[i] = mask
+            self.footprints[i] = footprint
+        if self.batch is not None:
+            self.batch.replace(indices.tolist(), networks)
+
+    def write_fitness(self):
+        """Copy the fitness of every car to its neural network."""
+        for nn, fitness in zip(self.networks, self.fitness.tolist()):
+            nn.fitness = fitness
@@ -0,0 +1,119 @@
+from collections import defaultdict
+import contextlib
+import json
+import time
+
+import config as cf
+
+# Returned by disabled profilers, entering it does nothing:
+_NO_PHASE = contextlib.nullcontext()
+
+
+class Phase:
+    """
+    Represents a timed phase of a frame, used as a context manager. A phase
+    entered inside another one is part of the outer phase and not timed on
+    its own, so the phases of a frame never overlap.
+
+    Attributes:
+    - name (str): The name of the phase.
+    - profiler (Profiler): The profiler holding the total seconds per phase.
+    """
+    __slots__ = ("name", "profiler", "start")
+
+    def __init__(self, name, profiler):
+        self.name = name
+        self.profiler = profiler
+        self.start = 0
+
+    def __enter__(self):
+        self.profiler.depth += 1
+        if self.profiler.depth == 1:
+            self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.profiler.depth == 1:
+            self.profiler.times[self.name] += time.perf_counter() - self.start
+        self.profiler.depth -= 1
+
+
+class Profiler:
+    """
+    Represents timers for the phases of a frame and counters of the work done.
+
+    A frame is one simulated step, on any track. Only the outermost phase
+    of nested phases is timed, so the phases add up to the time of the
+    frames. The totals are averaged per frame every interval frames, and
+    the averages are appended to a JSONL file if a path is given. A
+    disabled profiler hands out a shared no-op context manager and ignores
+    counts, and hot loops check enabled before computing counts.
+
+    Attributes:
+    - enabled (bool): Whether the phases are timed and the work is counted.
+    - path (str): The JSONL file the averages are appended to, or None.
+    - interval (int): The number of frames averaged per report.
+    - frames (int): The number of frames since the profiler was created.
+    - report (dict): The last averages, milliseconds per phase and counts
+        per frame.
+
+    Methods:
+    - phase(name): Return a context manager that times the phase.
+
+    - count(name, amount): Add the amount to the counter.
+
+    - end_frame(frames): Finish frames and report the averages every interval frames.
+    """
+
+    def __init__(self, enabled=cf.PROFILE, path=cf.PROFILE_PATH, interval=cf.PROFILE_INTERVAL):
+        self.enabled = enabled
+        self.path = path
+        self.interval = interval
+        self.frames = 0
+        self.report = {}
+        self.times = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.phases = {}
+        self.depth = 0
+        self.window_frames = 0
+
+    def phase(self, name):
+        if not self.enabled:
+            return _NO_PHASE
+        if name not in self.phases:
+            self.phases[name] = Phase(name, self)
+        return self.phases[name]
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.counters[name] += amount
+
+    def end_frame(self, frames=1):
+        """Finish the frame. Every interval frames, store the averages per
+        frame in report, append them to the JSONL file and start over.
+
+        Args:
+            frames (int): The number of frames finished at once, for steps
+                simulated by other processes.
+        """
+        if not self.enabled or not frames:
+            return
+        self.frames += frames
+        self.window_frames += frames
+        if self.window_frames < self.interval:
+            return
+        frames = self.window_frames
+        self.report = {
+            "frame": self.frames,
+            "time": time.time(),
+            "phases_ms": {name: total*1000/frames for name, total in self.times.items()},
+            "counters": {name: total/frames for name, total in self.counters.items()},
+        }
+        if self.path:
+            with open(self.path, "a") as file:
+                file.write(json.dumps(self.report) + "\n")
+        self.times.clear()
+        self.counters.clear()
+        self.window_frames = 0
+
+
+profiler = Profiler()
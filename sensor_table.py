@@ -0,0 +1,150 @@
+import argparse
+import hashlib
+import os
+import numpy as np
+
+import config as cf
+from atomic import atomic_write
+from population import Population
+from sensors import SensorTable
+
+# Road cells whose readings are computed at once while building a table:
+BUILD_CHUNK = 256
+# Version of the table contents, raised when the readings are computed differently:
+TABLE_VERSION = 2
+
+
+def get_table_shape(track, cell=cf.SENSOR_TABLE_CELL, headings=cf.SENSOR_TABLE_HEADINGS):
+    height, width = track.road.shape
+    return -(-height // cell), -(-width // cell), headings, cf.NUM_INPUTS
+
+
+def get_table_path(track, cell=cf.SENSOR_TABLE_CELL, headings=cf.SENSOR_TABLE_HEADINGS):
+    """Return the cache file of the track's sensor table. Its name contains
+    a hash of every setting the readings depend on.
+
+    Args:
+        track (Track): The preprocessed track.
+        cell (int): The size of the grid cells in pixels.
+        headings (int): The number of headings per turn.
+
+    Returns:
+        str: The path of the .npy file.
+    """
+    settings = (f"{TABLE_VERSION}:{cell}:{headings}:{cf.NUM_INPUTS}:{cf.CAR_FOV}:{cf.RAY_SPEED}:"
+                f"{cf.CAR_MAX_VIEW_DISTANCE}:{cf.RAY_EXACT_HIT}:{cf.RAY_TOLERANCE}:"
+                f"{cf.ROTATION_RESOLUTION}:{cf.CAR_IMAGE}")
+    key = hashlib.sha256(f"{track.key}:{settings}".encode()).hexdigest()[:16]
+    return os.path.join(cf.TRACK_CACHE_DIR, f"{track.key}.sensors.{key}.npy")
+
+
+def nearest_road_cells(road):
+    """Return the nearest road cell of every cell of a grid, found by
+    growing the road one cell in all eight directions at a time.
+
+    Args:
+        road (numpy.ndarray): Boolean array indexed [row, column], True
+            where the center of the cell is on the road.
+
+    Returns:
+        tuple: The row and column of the nearest road cell of each cell,
+            indexed [row, column].
+    """
+    height, width = road.shape
+    rows, columns = np.indices(road.shape)
+    found = road.copy()
+    offsets = [(dy, dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dy or dx]
+    while road.any() and not found.all():
+        grown = found.copy()
+        for dy, dx in offsets:
+            # Cells not found yet take the nearest cell of a neighbor found before this step:
+            target = (slice(max(dy, 0), height + min(dy, 0)), slice(max(dx, 0), width + min(dx, 0)))
+            source = (slice(max(-dy, 0), height + min(-dy, 0)), slice(max(-dx, 0), width + min(-dx, 0)))
+            take = found[source] & ~grown[target]
+            rows[target][take] = rows[source][take]
+            columns[target][take] = columns[source][take]
+            grown[target] |= take
+        found = grown
+    return rows, columns
+
+
+def build_sensor_table(track, table, cell=cf.SENSOR_TABLE_CELL):
+    """Compute the ray readings of cars centered on the center of every
+    road cell at every heading, with the distance field sensor. Cells off
+    the road get the readings of the nearest road cell, so cars near a wall
+    never blend in readings of zero when the table is interpolated.
+
+    Args:
+        track (Track): The preprocessed track.
+        table (numpy.ndarray): The array to fill, indexed [row, column,
+            heading, ray].
+        cell (int): The size of the grid cells in pixels.
+    """
+    headings = table.shape[2]
+    road = track.road[cell//2::cell, cell//2::cell]
+    rows, columns = np.nonzero(road)
+    angles = np.arange(headings) * (360/headings)
+    for start in range(0, len(rows), BUILD_CHUNK):
+        r, c = rows[start:start+BUILD_CHUNK], columns[start:start+BUILD_CHUNK]
+        n = len(r) * headings
+        population = Population([None] * n, track.start)
+        dx, dy = population.center
+        population.x[:] = np.repeat(c*cell + cell//2, headings) - dx
+        population.y[:] = np.repeat(r*cell + cell//2, headings) - dy
+        population.angle[:] = np.tile(angles, len(r))
+        indices = np.arange(n)
+        population.update_masks(indices)
+        readings = population.sense(indices, track.mask, track.field)
+        table[r, c] = readings.reshape(len(r), headings, -1)
+
+    # Cells off the road take the readings of the nearest road cell:
+    nearest_rows, nearest_columns = nearest_road_cells(road)
+    rows, columns = np.nonzero(~road)
+    for start in range(0, len(rows), BUILD_CHUNK):
+        r, c = rows[start:start+BUILD_CHUNK], columns[start:start+BUILD_CHUNK]
+        table[r, c] = table[nearest_rows[r, c], nearest_columns[r, c]]
+
+
+def load_sensor_table(track, cell=cf.SENSOR_TABLE_CELL, headings=cf.SENSOR_TABLE_HEADINGS):
+    """Return the sensor table of the track. It is memory-mapped from
+    cf.TRACK_CACHE_DIR, and built and stored there first if missing.
+
+    Args:
+        track (Track): The preprocessed track.
+        cell (int): The size of the grid cells in pixels.
+        headings (int): The number of headings per turn.
+
+    Returns:
+        SensorTable: The sensor table of the track.
+    """
+    shape = get_table_shape(track, cell, headings)
+    size = int(np.prod(shape)) * np.dtype(np.uint16).itemsize
+    if size > cf.SENSOR_TABLE_MAX_BYTES:
+        raise Exception(f"The sensor table of {track.path} needs {size/2**20:.0f} MB, more than "
+                        f"SENSOR_TABLE_MAX_BYTES. Use a larger cell or fewer headings.")
+    if not cf.TRACK_CACHE_DIR:
+        table = np.zeros(shape, dtype=np.uint16)
+        build_sensor_table(track, table, cell)
+        return SensorTable(table, cell)
+
+    path = get_table_path(track, cell, headings)
+    if not os.path.exists(path):
+        os.makedirs(cf.TRACK_CACHE_DIR, exist_ok=True)
+        with atomic_write(path, ".npy") as temporary:
+            table = np.lib.format.open_memmap(temporary, mode="w+", dtype=np.uint16, shape=shape)
+            build_sensor_table(track, table, cell)
+            table.flush()
+            del table
+    return SensorTable.open(path, cell)
+
+
+if __name__ == "__main__":
+    # Build the sensor tables ahead of time, later runs map them from the cache:
+    from track import Track
+
+    parser = argparse.ArgumentParser(description="Precompute the sensor tables of tracks.")
+    parser.add_argument("tracks", metavar="PATH", nargs="*", default=cf.TRACK_IMAGES,
+                        help="track images to build the tables of")
+    for path in parser.parse_args().tracks:
+        table = load_sensor_table(Track(path))
+        print(f"{path}: {table.path} ({table.table.nbytes/2**20:.1f} MB)")
@@ -0,0 +1,422 @@
+import heapq
+import math
+import pygame as pg
+import numpy as np
+
+import config as cf
+
+# A point within this distance of a pixel center may lie in a neighbouring
+# pixel, so field values are reduced by it before being trusted as free space.
+PIXEL_MARGIN = 1.5
+
+
+def mask_to_array(mask):
+    """Return the bits of a pygame mask as a boolean array indexed [y, x].
+
+    Args:
+        mask (pygame.Mask): The mask to convert.
+
+    Returns:
+        numpy.ndarray: True where the mask bit is set.
+    """
+    return pg.surfarray.array_red(mask.to_surface()).T > 0
+
+
+def distance_field(road, max_distance):
+    """Compute the Euclidean distance from every pixel to the nearest
+    off-road pixel, clipped at max_distance.
+
+    Everything outside the image counts as off-road. The distance is exact
+    wherever it is below max_distance.
+
+    Args:
+        road (numpy.ndarray): Boolean array indexed [y, x], True on the road.
+        max_distance (int): The distance at which the field is clipped.
+
+    Returns:
+        numpy.ndarray: Float32 array indexed [y, x] with the distances.
+    """
+    height, width = road.shape
+    off_road = ~road
+    rows = np.arange(height, dtype=np.float32)[:, None]
+
+    # Vertical distance to the nearest off-road pixel in the same column:
+    above = np.maximum.accumulate(np.where(off_road, rows, -1), axis=0)
+    below = np.minimum.accumulate(np.where(off_road, rows, height)[::-1], axis=0)[::-1]
+    vertical = np.minimum(np.minimum(rows - above, below - rows), max_distance)
+
+    # Combine with horizontal offsets, the padding is off-road:
+    r = max_distance
+    padded = np.pad(vertical**2, ((0, 0), (r, r)))
+    squared = padded[:, r:r+width].copy()
+    for dx in range(1, r+1):
+        np.minimum(squared, padded[:, r-dx:r-dx+width] + dx*dx, out=squared)
+        np.minimum(squared, padded[:, r+dx:r+dx+width] + dx*dx, out=squared)
+    return np.minimum(np.sqrt(squared), max_distance).astype(np.float32)
+
+
+def progress_field(road, start, cell=cf.PROGRESS_CELL):
+    """Return how far along the track each cell of the road is from the
+    start, travelling in the starting direction.
+
+    The road is cut across at the start, so the shortest paths from just
+    ahead of the cut go around the track and the cells just behind it are
+    about a lap away.
+
+    Args:
+        road (numpy.ndarray): Boolean array indexed [y, x], True on the road.
+        start (tuple): The starting pose (x0, y0, start_angle) of the cars.
+        cell (int): The size of the cells in pixels.
+
+    Returns:
+        numpy.ndarray: The distance in pixels of every cell indexed [row,
+            column], NaN where the road is not reachable.
+    """
+    x0, y0, start_angle = start
+    radians = math.radians(start_angle)
+    hx, hy = math.cos(radians), -math.sin(radians)
+    nx, ny = -hy, hx
+
+    # Measure the width of the road on both sides of the start:
+    height, width = road.shape
+    widths = []
+    for sign in (1, -1):
+        t = 0
+        while True:
+            x, y = int(x0 + sign*t*nx), int(y0 + sign*t*ny)
+            if not (0 <= x < width and 0 <= y < height and road[y, x]):
+                break
+            t += 1
+        widths.append(t + cell)
+
+    cells = road[cell//2::cell, cell//2::cell]
+    rows, columns = cells.shape
+    cy, cx = np.mgrid[:rows, :columns] * cell + cell//2
+    along = (cx - x0)*hx + (cy - y0)*hy
+    across = (cx - x0)*nx + (cy - y0)*ny
+    near = cells & (across <= widths[0]) & (across >= -widths[1])
+    cut = near & (np.abs(along) < cell)
+    seeds = near & (along >= cell) & (along < 2*cell)
+
+    # Dijkstra over the cells with 8 neighbours:
+    passable = (cells & ~cut).tolist()
+    distance = np.full(cells.shape, np.inf)
+    done = np.zeros(cells.shape, dtype=bool).tolist()
+    heap = [(float(along[r, c]), r, c) for r, c in zip(*np.nonzero(seeds))]
+    heapq.heapify(heap)
+    steps = [(dr, dc, math.hypot(dr, dc)*cell) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc]
+    while heap:
+        d, r, c = heapq.heappop(heap)
+        if done[r][c]:
+            continue
+        done[r][c] = True
+        distance[r, c] = d
+        for dr, dc, length in steps:
+            r2, c2 = r + dr, c + dc
+            if 0 <= r2 < rows and 0 <= c2 < columns and passable[r2][c2] and not done[r2][c2]:
+                heapq.heappush(heap, (d + length, r2, c2))
+
+    distance[cut] = 0
+    distance[np.isinf(distance)] = np.nan
+    return distance.astype(np.float32)
+
+
+def mask_radii(mask):
+    """Return the sorted distances of the set bits from the center of the
+    mask, enlarged by the up to one pixel shift of placing the mask at
+    integer coordinates.
+
+    Args:
+        mask (pygame.Mask): The mask to measure.
+
+    Returns:
+        numpy.ndarray: The distances in pixels.
+    """
+    w, h = mask.get_size()
+    ys, xs = np.nonzero(mask_to_array(mask))
+    return np.sort(np.hypot(np.abs(xs - w/2) + 1, np.abs(ys - h/2) + 1))
+
+
+def half_radius(mask):
+    """Return the smallest radius around the center of the mask that holds
+    more than half of its set bits, wherever the mask is placed.
+
+    Rotating a mask about its center keeps the radius up to resampling.
+
+    Args:
+        mask (pygame.Mask): The mask to measure.
+
+    Returns:
+        float: The radius in pixels.
+    """
+    radii = mask_radii(mask)
+    return float(radii[len(radii)//2])
+
+
+def bounding_radius(mask):
+    """Return the radius around the center of the mask that holds all of
+    its set bits, wherever the mask is placed.
+
+    Args:
+        mask (pygame.Mask): The mask to measure.
+
+    Returns:
+        float: The radius in pixels.
+    """
+    return float(mask_radii(mask)[-1])
+
+
+def footprint(mask, spacing=cf.FOOTPRINT_SPACING):
+    """Return sample points of a mask for collision tests: every pixel on
+    the outline and the pixels on a grid with the given spacing inside.
+
+    Args:
+        mask (pygame.Mask): The mask to sample.
+        spacing (int): The grid spacing of the interior points, 1 to
+            sample every pixel and match the mask exactly.
+
+    Returns:
+        numpy.ndarray: The (x, y) points within the mask, shape (2, k).
+    """
+    pixels = mask_to_array(mask)
+    padded = np.pad(pixels, 1)
+    interior = padded[:-2, 1:-1] & padded[2:, 1:-1] & padded[1:-1, :-2] & padded[1:-1, 2:]
+    ys, xs = np.mgrid[:pixels.shape[0], :pixels.shape[1]]
+    sampled = pixels & (~interior | ((xs % spacing == 0) & (ys % spacing == 0)))
+    ys, xs = np.nonzero(sampled)
+    return np.array([xs, ys])
+
+
+def march_ray(track_mask, mask, x0, y0, dir_x, dir_y, offset, start=0, stride=1):
+    """Move a mask along a ray until it overlaps the track with at most half
+    of its pixels and return the number of RAY_SPEED steps taken.
+
+    Args:
+        track_mask (pygame.Mask): Pygame mask of the track.
+        mask (pygame.Mask): The mask to move along the ray.
+        x0, y0 (float): The origin of the ray.
+        dir_x, dir_y (float): The unit direction of the ray.
+        offset (tuple): The position of the ray origin within the mask.
+        start (int): The step to start at, all earlier steps must be clear.
+        stride (int): Test every stride steps. The result is then only
+            approximate: the overlap is not monotone along a ray, so a
+            stride can step over the first hit and end well past it.
+
+    Returns:
+        int: The number of steps until collision, at most CAR_MAX_VIEW_DISTANCE.
+    """
+    half_mask_count = mask.count()/2
+    dx, dy = offset
+    step_x, step_y = dir_x * cf.RAY_SPEED, dir_y * cf.RAY_SPEED
+    distance = start
+    while distance < cf.CAR_MAX_VIEW_DISTANCE:
+        x = x0 + step_x * distance
+        y = y0 + step_y * distance
+        if track_mask.overlap_area(mask, (int(x-dx), int(y-dy))) <= half_mask_count:
+            break
+        distance += stride
+    return min(distance, cf.CAR_MAX_VIEW_DISTANCE)
+
+
+class DistanceField:
+    """
+    Represents a track preprocessed for fast ray casting.
+
+    Rays are sphere traced: each step advances the ray by the distance to
+    the nearest wall, so a ray costs a handful of lookups instead of one
+    mask overlap test per RAY_SPEED pixels. All methods trace many rays at
+    once.
+
+    Attributes:
+    - mask (pygame.Mask): Pygame mask of the track.
+    - road (numpy.ndarray): Boolean array indexed [y, x], True on the road.
+    - field (numpy.ndarray): Distance to the nearest off-road pixel, indexed [y, x].
+
+    Methods:
+    - lookup(x, y): Return the field values at points, 0 outside the track.
+
+    - skip(x, y, dir_x, dir_y, radius): Return the number of RAY_SPEED steps
+        each ray can take while clear of walls by more than radius.
+
+    - trace(x, y, dir_x, dir_y): Return the number of RAY_SPEED steps until
+        each ray reaches a wall.
+    """
+
+    def __init__(self, track_mask, road=None, field=None, max_distance=cf.RAY_FIELD_MAX_DISTANCE):
+        self.mask = track_mask
+        self.road = road if road is not None else mask_to_array(track_mask)
+        self.field = field if field is not None else distance_field(self.road, max_distance)
+        self.height, self.width = self.road.shape
+
+    def lookup(self, x, y):
+        """Return the field values at the given points, 0 outside the track.
+
+        Args:
+            x, y (numpy.ndarray): The coordinates of the points.
+
+        Returns:
+            numpy.ndarray: The field value at each point.
+        """
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        values = np.zeros(len(x), dtype=np.float32)
+        values[inside] = self.field[y[inside].astype(int), x[inside].astype(int)]
+        return values
+
+    def skip(self, x, y, dir_x, dir_y, radius):
+        """Return the number of RAY_SPEED steps each ray can take while every
+        point within radius of it is guaranteed to be on the road.
+
+        Args:
+            x, y (numpy.ndarray): The origins of the rays.
+            dir_x, dir_y (numpy.ndarray): The unit directions of the rays.
+            radius (float): The clearance the rays must keep to the walls.
+
+        Returns:
+            numpy.ndarray: The number of clear steps of each ray.
+        """
+        steps = np.zeros(len(x), dtype=int)
+        active = np.arange(len(x))
+        while active.size:
+            length = steps[active] * cf.RAY_SPEED
+            free = self.lookup(x[active] + dir_x[active]*length,
+                               y[active] + dir_y[active]*length) - PIXEL_MARGIN - radius
+            clear = free > 0
+            active = active[clear]
+            steps[active] += np.ceil(free[clear] / cf.RAY_SPEED).astype(int)
+            active = active[steps[active] < cf.CAR_MAX_VIEW_DISTANCE]
+        return np.minimum(steps, cf.CAR_MAX_VIEW_DISTANCE)
+
+    def trace(self, x, y, dir_x, dir_y):
+        """Sphere trace points until they leave the road.
+
+        Args:
+            x, y (numpy.ndarray): The origins of the rays.
+            dir_x, dir_y (numpy.ndarray): The unit directions of the rays.
+
+        Returns:
+            numpy.ndarray: The number of RAY_SPEED steps until each ray hits.
+        """
+        max_length = cf.CAR_MAX_VIEW_DISTANCE * cf.RAY_SPEED
+        lengths = np.zeros(len(x))
+        active = np.arange(len(x))
+        while active.size:
+            distance = self.lookup(x[active] + dir_x[active]*lengths[active],
+                                   y[active] + dir_y[active]*lengths[active])
+            active = active[distance > 1]
+            lengths[active] += np.maximum(distance[distance > 1] - PIXEL_MARGIN, 1)
+            active = active[lengths[active] < max_length]
+        return np.minimum(np.ceil(lengths / cf.RAY_SPEED), cf.CAR_MAX_VIEW_DISTANCE).astype(int)
+
+
+class ProgressField:
+    """
+    Represents the progress along a track from the start, looked up by position.
+
+    Attributes:
+    - progress (numpy.ndarray): The distance along the track of every cell,
+        NaN where the road is not reachable.
+    - cell (int): The size of the cells in pixels.
+    - length (float): The length of a lap.
+
+    Methods:
+    - lookup(x, y): Return the progress at points, NaN off the road.
+    """
+
+    def __init__(self, progress, cell=cf.PROGRESS_CELL):
+        self.progress = progress
+        self.cell = cell
+        self.length = float(np.nanmax(progress)) if np.isfinite(progress).any() else 0.0
+
+    def lookup(self, x, y):
+        """Return the progress at the given points, NaN off the road.
+
+        Args:
+            x, y (numpy.ndarray): The coordinates of the points.
+
+        Returns:
+            numpy.ndarray: The progress at each point.
+        """
+        rows, columns = self.progress.shape
+        r, c = (y // self.cell).astype(int), (x // self.cell).astype(int)
+        inside = (c >= 0) & (c < columns) & (r >= 0) & (r < rows)
+        values = np.full(len(x), np.nan, dtype=np.float32)
+        values[inside] = self.progress[r[inside], c[inside]]
+        return values
+
+
+class SensorTable:
+    """
+    Represents precomputed ray readings of a track for cars centered on a
+    grid of positions at a number of headings.
+
+    Attributes:
+    - table (numpy.ndarray): The readings indexed [row, column, heading,
+        ray], memory-mapped read-only when loaded from a file.
+    - cell (int): The size of the grid cells in pixels.
+    - headings (int): The number of headings per turn.
+    - path (str): The file the table is memory-mapped from, or None.
+
+    Methods:
+    - lookup(x, y, angle, interpolate): Return the ray readings of cars.
+    """
+
+    def __init__(self, table, cell=cf.SENSOR_TABLE_CELL, path=None):
+        self.table = table
+        self.cell = cell
+        self.headings = table.shape[2]
+        self.path = path
+
+    @classmethod
+    def open(cls, path, cell=cf.SENSOR_TABLE_CELL):
+        """Memory-map the table stored in the file read-only.
+
+        Args:
+            path (str): The path of the .npy file.
+            cell (int): The size of the grid cells in pixels.
+
+        Returns:
+            SensorTable: The table backed by the file.
+        """
+        return cls(np.load(path, mmap_mode="r"), cell, path)
+
+    def __reduce__(self):
+        # Memory-mapped tables are opened again by path, so processes share
+        # the pages of the file instead of receiving a copy:
+        if self.path is not None:
+            return SensorTable.open, (self.path, self.cell)
+        return SensorTable, (np.asarray(self.table), self.cell)
+
+    def lookup(self, x, y, angle, interpolate=cf.SENSOR_TABLE_INTERPOLATE):
+        """Return the ray readings of cars centered at the given points with
+        the given headings, of the nearest grid point and heading or
+        interpolated between the surrounding ones.
+
+        Args:
+            x, y (numpy.ndarray): The centers of the cars.
+            angle (numpy.ndarray): The headings of the cars in degrees.
+            interpolate (bool): Whether to interpolate trilinearly.
+
+        Returns:
+            numpy.ndarray: The readings of each car's rays, one row per car.
+        """
+        rows, columns = self.table.shape[:2]
+        heading = np.asarray(angle) % 360 * (self.headings/360)
+        if not interpolate:
+            r = np.clip(y // self.cell, 0, rows - 1).astype(int)
+            c = np.clip(x // self.cell, 0, columns - 1).astype(int)
+            h = np.round(heading).astype(int) % self.headings
+            return self.table[r, c, h].astype(float)
+
+        # Grid points lie at the centers of the cells:
+        u, v = x/self.cell - 0.5, y/self.cell - 0.5
+        c0, r0, h0 = np.floor(u), np.floor(v), np.floor(heading)
+        fu, fv, fh = (u - c0)[:, None], (v - r0)[:, None], (heading - h0)[:, None]
+        readings = 0
+        for dr, wr in ((0, 1 - fv), (1, fv)):
+            r = np.clip(r0 + dr, 0, rows - 1).astype(int)
+            for dc, wc in ((0, 1 - fu), (1, fu)):
+                c = np.clip(c0 + dc, 0, columns - 1).astype(int)
+                for dh, wh in ((0, 1 - fh), (1, fh)):
+                    h = (h0 + dh).astype(int) % self.headings
+                    readings = readings + wr*wc*wh*self.table[r, c, h]
+        return readings
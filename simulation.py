@@ -0,0 +1,333 @@
+import numpy as np
+
+import config as cf
+from neat import NEAT, NetworkBatch
+from car import Car
+from evaluation import FitnessCache, ParallelEvaluator, reduce_fitness, simulate
+from population import Population
+from profiling import profiler
+from stats import GenerationStats
+from track import Track
+
+# Color of cars whose network is not compatible with any species yet:
+NEW_SPECIES_COLOR = (128, 128, 128, 255)
+
+
+class Simulation:
+    """
+    Represents the car simulation, decoupled from the display and wall clock.
+
+    The simulation advances with a fixed timestep, so a generation lasts a
+    fixed number of simulated steps regardless of how fast they are computed.
+    Without a window it runs as fast as the CPU allows, and whole
+    generations can be evaluated in parallel by several processes. The cars
+    are driven step by step on the first track, the fitness on all tracks
+    is combined with cf.track_fitness.
+
+    In steady-state evolution every car that crashes or has driven for
+    cf.STEADY_STATE_STEPS joins the population as soon as it is done and is
+    replaced by a new offspring at the start, so no car waits for the
+    others. A generation then means cf.POPULATION_SIZE evaluated cars.
+
+    Attributes:
+    - neat (NEAT): The NEAT instance holding the population.
+    - tracks (list): The preprocessed tracks the fitness is evaluated on.
+    - track (Track): The first track, driven on step by step and displayed.
+    - field (DistanceField): Distance field for the ray sensors, or None when
+        rays march over the track mask.
+    - population (Population): The state of all cars of the current generation.
+    - individuals (list): Views on the cars of the current generation.
+    - steps (int): The number of steps simulated in the current generation.
+    - step_limit (int): The maximum number of steps of the current generation.
+    - stats (GenerationStats): Statistics of the fitness per second of past
+        generations and their species.
+    - evaluator (ParallelEvaluator): The worker processes evaluating whole
+        generations, or None to evaluate in-process.
+    - fitness_cache (FitnessCache): The evaluations of past generations,
+        reused for networks that did not change, or None.
+    - steady_state (bool): Whether finished cars are replaced at once.
+    - evaluated (int): The number of cars evaluated in the current
+        generation of steady-state evolution.
+
+    Methods:
+    - generate_individuals(): Start a new generation with a car for every
+        neural network.
+
+    - step(): Advance every car by one simulated step.
+
+    - get_color(nn): Return the color of the species the network belongs to.
+
+    - replace_finished(): Replace the finished cars with new offspring in
+        steady-state evolution.
+
+    - is_generation_done(): Return whether the current generation is over.
+
+    - evaluate_other_tracks(): Drive the generation on the other tracks and
+        combine the fitnesses.
+
+    - write_fitness(): Copy the fitnesses on all tracks to the networks.
+
+    - find_cached(networks): Return the cached evaluations of the networks.
+
+    - evaluate_generation(): Simulate the whole generation and write the
+        fitnesses.
+
+    - evolve(): Evolve the population and start a new generation.
+
+    - end_generation(): Write the fitnesses and evolve the population.
+
+    - run_generation(): Simulate a whole generation and evolve.
+
+    - run(generations): Simulate and evolve the given number of generations.
+
+    - close(): Shut down the worker processes.
+    """
+
+    def __init__(self, neat=None, track_paths=cf.TRACK_IMAGES, workers=cf.WORKERS):
+        self.neat = neat if neat else NEAT()
+        self.tracks = [Track(path) for path in track_paths]
+        self.track = self.tracks[0]
+        self.field = self.track.field if cf.RAY_SENSOR == "distance_field" else None
+        self.steps = 0
+        self.step_limit = cf.START_STEPS + (self.neat.generation-1)*cf.ADDED_STEPS
+        self.stats = GenerationStats(cf.STATS_PATH)
+        self.steady_state = cf.EVOLUTION == "steady_state"
+        self.evaluated = 0
+        parallel = workers > 1 and not self.steady_state
+        self.evaluator = ParallelEvaluator(self.tracks, workers) if parallel else None
+        cache = cf.FITNESS_CACHE_SIZE and not self.steady_state
+        self.fitness_cache = FitnessCache(cf.FITNESS_CACHE_SIZE) if cache else None
+        self.generate_individuals()
+
+    def generate_individuals(self):
+        """Generate a new population of cars and views on them using the
+        current neural networks in the neat instance.
+
+        In steady-state evolution this only happens once: the slots are
+        topped up with offspring, and the neat instance then only holds the
+        evaluated networks, which join it again as their cars finish.
+        """
+        networks, colors = [], []
+        for species in self.neat.population:
+            for nn in species.members:
+                networks.append(nn)
+                colors.append(species.color)
+        if self.steady_state:
+            for _ in range(cf.POPULATION_SIZE - len(networks)):
+                networks.append(self.neat.breed())
+                colors.append(self.get_color(networks[-1]))
+            self.neat.population = []
+            batch = NetworkBatch(networks)
+        else:
+            batch = self.neat.get_batch()
+        self.population = Population(networks, self.track.start, batch)
+        self.individuals = [Car(self.population, i, color) for i, color in enumerate(colors)]
+
+    def get_color(self, nn):
+        """Return the color of the species the network is compatible with.
+
+        Args:
+            nn (NeuralNetwork): The neural network.
+
+        Returns:
+            tuple: The RGBA color of the species.
+        """
+        species = self.neat.find_species(nn)
+        return species.color if species is not None else NEW_SPECIES_COLOR
+
+    def step(self):
+        """Advance every car by one simulated step."""
+        self.population.step(self.track.mask, self.field, self.track.road,
+                             self.track.progress, self.track.table)
+        if self.steady_state:
+            self.replace_finished()
+        self.steps += 1
+        profiler.end_frame()
+
+    def replace_finished(self):
+        """Add the networks of the cars that crashed or have driven for
+        cf.STEADY_STATE_STEPS to the population with their fitness on all
+        tracks, and replace the cars with new offspring at the start.
+        """
+        population = self.population
+        finished = np.flatnonzero(population.crashed | (population.age >= cf.STEADY_STATE_STEPS))
+        if not finished.size:
+            return
+        networks = [population.networks[i] for i in finished.tolist()]
+        fitnesses = [population.fitness[finished].tolist()]
+        for track in self.tracks[1:]:
+            fitnesses.append(simulate(networks, track, cf.STEADY_STATE_STEPS)[0])
+        with profiler.phase("replacement"):
+            for nn, fitness, age in zip(networks, reduce_fitness(fitnesses), population.age[finished].tolist()):
+                nn.fitness = fitness
+                species = self.neat.insert(nn)
+                self.stats.add(fitness * cf.STEPS_PER_SECOND / max(age, 1), species.id)
+            self.evaluated += len(networks)
+
+            children = [self.neat.breed() for _ in networks]
+            population.respawn(finished, children)
+            for i, nn in zip(finished.tolist(), children):
+                self.individuals[i] = Car(population, i, self.get_color(nn))
+
+    def is_generation_done(self):
+        """Return whether the time limit is reached or all cars have crashed,
+        or in steady-state evolution whether a population's worth of cars
+        has been evaluated.
+        """
+        if self.steady_state:
+            return self.evaluated >= cf.POPULATION_SIZE
+        return self.steps >= self.step_limit or self.population.crashed.all()
+
+    def evaluate_other_tracks(self):
+        """Drive the cars of the generation on the tracks after the first one
+        and combine each car's fitnesses on all tracks into its fitness.
+        """
+        fitnesses = [self.population.fitness.tolist()]
+        for track in self.tracks[1:]:
+            track_fitnesses, ages = simulate(self.population.networks, track, self.step_limit)
+            fitnesses.append(track_fitnesses)
+            self.steps = max([self.steps] + ages)
+        self.population.fitness[:] = reduce_fitness(fitnesses)
+
+    def write_fitness(self):
+        """Complete the evaluation on the other tracks if the generation was
+        driven in-process, and copy the fitnesses to the neural networks.
+        Steady-state evolution has copied them as the cars finished.
+        """
+        if self.steady_state:
+            return
+        if self.evaluator is None:
+            self.evaluate_other_tracks()
+        self.population.write_fitness()
+        self.neat.clear_species_cache()
+
+    def find_cached(self, networks):
+        """Return the hash of every network and the evaluations on all tracks
+        of the networks found in the fitness cache.
+
+        Args:
+            networks (list): The neural networks of the generation.
+
+        Returns:
+            tuple: The hash of every network, or None without a cache, and
+                the fitness and steps driven on every track by index of the
+                cached networks.
+        """
+        if self.fitness_cache is None:
+            return None, {}
+        hashes = [nn.get_hash() for nn in networks]
+        cached = {}
+        for i, genome in enumerate(hashes):
+            evaluations = [self.fitness_cache.get((genome, track.key), self.step_limit) for track in self.tracks]
+            if None not in evaluations:
+                cached[i] = evaluations
+        return hashes, cached
+
+    def evaluate_generation(self):
+        """Simulate the current generation until it is done and copy the
+        fitnesses to the neural networks.
+
+        Networks whose evaluation is in the fitness cache are not driven
+        again: their cars are off the track from the start and their
+        fitnesses on all tracks are taken from the cache.
+        """
+        if self.steady_state:
+            while not self.is_generation_done():
+                self.step()
+            return
+        population = self.population
+        networks = population.networks
+        hashes, cached = self.find_cached(networks)
+        rows = [i for i in range(len(networks)) if i not in cached]
+        driven = [networks[i] for i in rows]
+        if self.evaluator is not None:
+            with profiler.phase("evaluation"):
+                fitnesses, ages = self.evaluator.evaluate(driven, self.step_limit)
+            # The workers do not profile, the steps they simulated are frames here:
+            profiler.end_frame(sum(max(track_ages, default=0) for track_ages in ages))
+        else:
+            for i, evaluations in cached.items():
+                population.fitness[i], population.age[i] = evaluations[0]
+                population.crashed[i] = True
+            while not self.is_generation_done():
+                self.step()
+            fitnesses, ages = [population.fitness[rows].tolist()], [population.age[rows].tolist()]
+            for track in self.tracks[1:]:
+                track_fitnesses, track_ages = simulate(driven, track, self.step_limit)
+                fitnesses.append(track_fitnesses)
+                ages.append(track_ages)
+
+        # Combine the driven and cached evaluations, caching the new ones:
+        track_fitnesses = [[0.0] * len(networks) for _ in self.tracks]
+        self.steps = 0
+        for t, track in enumerate(self.tracks):
+            for i, fitness, steps in zip(rows, fitnesses[t], ages[t]):
+                track_fitnesses[t][i] = fitness
+                self.steps = max(self.steps, steps)
+                if self.fitness_cache is not None:
+                    self.fitness_cache.put((hashes[i], track.key), self.step_limit, fitness, steps)
+            for i, evaluations in cached.items():
+                track_fitnesses[t][i], steps = evaluations[t]
+                self.steps = max(self.steps, steps)
+        population.fitness[:] = reduce_fitness(track_fitnesses)
+        population.write_fitness()
+        self.neat.clear_species_cache()
+
+    def evolve(self):
+        """Record the fitnesses of the evaluated generation, evolve the
+        population and start a new generation with a longer time limit.
+
+        The population is saved to cf.CHECKPOINT_PATH before evolving, so a
+        run resumed from the checkpoint evaluates the generation again and
+        continues exactly as the interrupted run would have. In steady-state
+        evolution the population has evolved continuously, so only the
+        generation is counted.
+        """
+        if cf.CHECKPOINT_PATH:
+            self.neat.save(cf.CHECKPOINT_PATH)
+        if self.steady_state:
+            self.stats.end_generation(self.neat.generation, len(self.neat.population))
+            self.neat.generation += 1
+            self.evaluated = 0
+            self.steps = 0
+            return
+        seconds = self.steps / cf.STEPS_PER_SECOND
+        # Immigrants were evaluated in generations of another length:
+        evaluated = {id(nn) for nn in self.population.networks}
+        for species in self.neat.population:
+            for nn in species.members:
+                if id(nn) in evaluated:
+                    self.stats.add(nn.fitness/seconds, species.id)
+        self.stats.end_generation(self.neat.generation, len(self.neat.population))
+        with profiler.phase("evolve"):
+            self.neat.evolve()
+        self.step_limit += cf.ADDED_STEPS
+        self.generate_individuals()
+        self.steps = 0
+
+    def end_generation(self):
+        """Write the fitnesses of the generation driven step by step and
+        evolve the population.
+        """
+        self.write_fitness()
+        self.evolve()
+
+    def run_generation(self):
+        """Simulate the current generation until it is done, then evolve."""
+        self.evaluate_generation()
+        self.evolve()
+
+    def run(self, generations=cf.GENERATIONS):
+        """Simulate and evolve the given number of generations.
+
+        Args:
+            generations (int): The number of generations to run.
+        """
+        for _ in range(generations):
+            self.run_generation()
+
+    def close(self):
+        """Shut down the worker processes, if any."""
+        if self.evaluator is not None:
+            self.evaluator.close()
+            self.evaluator = None
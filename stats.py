@@ -0,0 +1,204 @@
+import bisect
+import csv
+import json
+import os
+from collections import deque
+
+import config as cf
+
+# Columns of the rows appended to the log, one row per generation and species:
+COLUMNS = ["generation", "species", "count", "mean", "median", "max", "num_species"]
+
+
+class P2Quantile:
+    """
+    Represents a streaming estimate of a quantile with the P² algorithm
+    (Jain and Chlamtac, 1985). Instead of the values, five markers are kept
+    whose heights follow the minimum, the quantile, the maximum and two
+    quantiles in between, so the memory does not grow with the stream.
+
+    Attributes:
+    - p (float): The quantile to estimate, 0.5 for the median.
+    - count (int): The number of values added.
+
+    Methods:
+    - add(value): Add a value to the stream.
+
+    - value(): Return the estimate of the quantile.
+    """
+    __slots__ = ("p", "count", "heights", "positions", "desired", "increments")
+
+    def __init__(self, p=0.5):
+        self.p = p
+        self.count = 0
+        self.heights = []
+        self.positions = [0, 1, 2, 3, 4]
+        self.desired = [0, 2*p, 4*p, 2 + 2*p, 4]
+        self.increments = [0, p/2, p, (1 + p)/2, 1]
+
+    def add(self, value):
+        self.count += 1
+        q, n = self.heights, self.positions
+        if self.count <= 5:
+            bisect.insort(q, value)
+            return
+
+        # Find the cell of the value, extending the extreme markers:
+        if value < q[0]:
+            q[0] = value
+        elif value > q[4]:
+            q[4] = value
+        k = min(max(bisect.bisect_right(q, value) - 1, 0), 3)
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # Move the middle markers that are off their desired positions:
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i+1] - n[i] > 1) or (d <= -1 and n[i-1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = q[i] + d/(n[i+1] - n[i-1]) * (
+                    (n[i] - n[i-1] + d)*(q[i+1] - q[i])/(n[i+1] - n[i]) +
+                    (n[i+1] - n[i] - d)*(q[i] - q[i-1])/(n[i] - n[i-1]))
+                if not q[i-1] < height < q[i+1]:
+                    height = q[i] + d*(q[i+d] - q[i])/(n[i+d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def value(self):
+        """Return the estimate of the quantile, exact for up to five values
+        and 0 for none.
+
+        Returns:
+            float: The estimated quantile.
+        """
+        q = self.heights
+        if self.count > 5:
+            return q[2]
+        if not q:
+            return 0.0
+        position = self.p * (len(q) - 1)
+        low = int(position)
+        high = min(low + 1, len(q) - 1)
+        return q[low] + (q[high] - q[low])*(position - low)
+
+
+class RunningStats:
+    """
+    Represents the count, mean, median and maximum of a stream of values
+    in constant memory.
+
+    Attributes:
+    - count (int): The number of values added.
+    - mean (float): The mean of the values.
+    - max (float): The largest value.
+    - median (P2Quantile): The streaming estimate of the median.
+
+    Methods:
+    - add(value): Add a value to the stream.
+
+    - summary(): Return the aggregates as a dictionary.
+    """
+    __slots__ = ("count", "mean", "max", "median")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.max = 0.0
+        self.median = P2Quantile(0.5)
+
+    def add(self, value):
+        self.count += 1
+        self.mean += (value - self.mean) / self.count
+        self.max = value if self.count == 1 else max(self.max, value)
+        self.median.add(value)
+
+    def summary(self):
+        return {"count": self.count, "mean": self.mean, "median": self.median.value(), "max": self.max}
+
+
+class GenerationStats:
+    """
+    Represents the fitness statistics of an evolution in bounded memory.
+
+    The fitnesses of the current generation stream into running aggregates
+    of the whole population and of each species. When the generation ends,
+    its summaries are appended to the log, the population's summary is
+    kept in a bounded history, and the aggregates start over. The latest
+    summary and the best fitness are read in constant time.
+
+    Attributes:
+    - path (str): The file the summaries are appended to, as CSV if it ends
+        with .csv and as JSONL otherwise, or None.
+    - current (RunningStats): The fitnesses of the current generation so far.
+    - species (dict): The running aggregates of each species in the current
+        generation, by species ID.
+    - last (dict): The summary of the last finished generation.
+    - best (float): The highest fitness of all generations.
+    - history (collections.deque): The summaries of the last finished generations.
+
+    Methods:
+    - add(fitness, species): Add the fitness of an individual of the species.
+
+    - end_generation(generation, num_species): Log and keep the summaries
+        of the generation and start the next one.
+    """
+
+    def __init__(self, path=None, history=cf.STATS_HISTORY):
+        self.path = path
+        self.current = RunningStats()
+        self.species = {}
+        self.last = {"generation": 0, **RunningStats().summary(), "num_species": 0}
+        self.best = 0.0
+        self.history = deque(maxlen=history)
+
+    def add(self, fitness, species):
+        """Add the fitness of an individual.
+
+        Args:
+            fitness (float): The fitness of the individual.
+            species (int): The ID of the individual's species.
+        """
+        self.current.add(fitness)
+        if species not in self.species:
+            self.species[species] = RunningStats()
+        self.species[species].add(fitness)
+        self.best = max(self.best, fitness)
+
+    def end_generation(self, generation, num_species):
+        """Log and keep the summaries of the finished generation and start
+        aggregating the next one.
+
+        Args:
+            generation (int): The number of the finished generation.
+            num_species (int): The number of species in the population.
+        """
+        self.last = {"generation": generation, "species": "all", **self.current.summary(),
+                     "num_species": num_species}
+        self.history.append(self.last)
+        if self.path:
+            rows = [self.last] + [{"generation": generation, "species": species, **stats.summary()}
+                                  for species, stats in self.species.items()]
+            self.write(rows)
+        self.current = RunningStats()
+        self.species = {}
+
+    def write(self, rows):
+        """Append the rows to the log file.
+
+        Args:
+            rows (list): The summaries to append.
+        """
+        if self.path.endswith(".csv"):
+            new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            with open(self.path, "a", newline="") as file:
+                writer = csv.DictWriter(file, COLUMNS)
+                if new:
+                    writer.writeheader()
+                writer.writerows(rows)
+        else:
+            with open(self.path, "a") as file:
+                for row in rows:
+                    file.write(json.dumps(row) + "\n")
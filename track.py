@@ -0,0 +1,160 @@
+import hashlib
+import io
+import math
+import os
+import pygame as pg
+import numpy as np
+
+import config as cf
+from atomic import atomic_write
+from sensor_table import load_sensor_table
+from sensors import DistanceField, ProgressField, distance_field, progress_field
+
+# Bump when the preprocessing changes so stale cache files are not used.
+CACHE_VERSION = 2
+
+
+def find_road(pixels):
+    """Return where the track is drawn, i.e. every pixel that is not white.
+
+    Args:
+        pixels (numpy.ndarray): RGB values of the image indexed [x, y].
+
+    Returns:
+        numpy.ndarray: Boolean array indexed [y, x], True on the road.
+    """
+    return ~np.all(pixels == 255, axis=2).T
+
+
+def find_start(pixels):
+    """Find the starting point and angle of the cars from the red line.
+
+    Args:
+        pixels (numpy.ndarray): RGB values of the image indexed [x, y].
+
+    Returns:
+        tuple: The starting pose (x0, y0, start_angle) of the cars.
+    """
+    red, green, blue = pixels[..., 0], pixels[..., 1], pixels[..., 2]
+    xs, ys = np.nonzero((red > 150) & (green < 100) & (blue < 100))
+    if len(xs) < 2:
+        raise Exception("The track must have at least 2 red starting pixels.")
+    x0, y0 = int(xs[len(xs)//2]), int(ys[len(ys)//2])
+    x1, y1, x2, y2 = xs[0], ys[0], xs[-1], ys[-1]
+    start_angle = math.degrees(math.atan2(y2-y1, x2-x1))
+    return x0, y0, start_angle
+
+
+def road_to_mask(road):
+    """Return a pygame mask with the bits set where the road is.
+
+    Args:
+        road (numpy.ndarray): Boolean array indexed [y, x], True on the road.
+
+    Returns:
+        pygame.Mask: The mask of the road.
+    """
+    surface = pg.surfarray.make_surface(np.repeat(road.T[..., None], 3, axis=2).astype(np.uint8))
+    surface.set_colorkey((0, 0, 0))
+    return pg.mask.from_surface(surface)
+
+
+class Track:
+    """
+    Represents a preprocessed track.
+
+    Preprocessing results are stored in cf.TRACK_CACHE_DIR under a hash of
+    the image content, so later runs on the same image load them instead.
+
+    Attributes:
+    - path (str): Path to the PNG image of the track.
+    - image (pygame.Surface): The track image.
+    - key (str): Hash of the image content and preprocessing settings.
+    - road (numpy.ndarray): Boolean array indexed [y, x], True on the road.
+    - mask (pygame.Mask): Pygame mask of the track.
+    - start (tuple): The starting pose (x0, y0, start_angle) of the cars.
+    - field (DistanceField): Distance field of the track for the ray sensors.
+    - progress (ProgressField): Progress along the track from the start.
+    - table (SensorTable): Precomputed ray readings when cf.RAY_SENSOR is
+        "table", otherwise None.
+
+    Methods:
+    - preprocess(): Compute the data derived from the image and return it.
+
+    - load_cache(): Return the cached data of the track, or None.
+
+    - save_cache(data): Store the data of the track in the cache.
+    """
+
+    def __init__(self, path=cf.TRACK_IMAGE):
+        self.path = path
+        with open(path, "rb") as file:
+            content = file.read()
+        self.image = pg.image.load(io.BytesIO(content), path)
+        settings = f"{CACHE_VERSION}:{cf.RAY_FIELD_MAX_DISTANCE}:{cf.PROGRESS_CELL}".encode()
+        self.key = hashlib.sha256(content + settings).hexdigest()
+
+        data = self.load_cache()
+        if data is None:
+            data = self.preprocess()
+            self.save_cache(data)
+
+        self.road = data["road"]
+        x0, y0, start_angle = data["start"].tolist()
+        self.start = int(x0), int(y0), start_angle
+        self.mask = road_to_mask(self.road)
+        self.field = DistanceField(self.mask, self.road, data["field"])
+        self.progress = ProgressField(data["progress"])
+        self.table = load_sensor_table(self) if cf.RAY_SENSOR == "table" else None
+
+    def preprocess(self):
+        """Compute the road, starting pose, distance field and progress field
+        from the image.
+
+        Returns:
+            dict: The preprocessed arrays of the track.
+        """
+        pixels = pg.surfarray.pixels3d(self.image)
+        road = find_road(pixels)
+        start = find_start(pixels)
+        del pixels
+        return {"road": road,
+                "start": np.array(start),
+                "field": distance_field(road, cf.RAY_FIELD_MAX_DISTANCE),
+                "progress": progress_field(road, start)}
+
+    def get_cache_path(self):
+        return os.path.join(cf.TRACK_CACHE_DIR, f"{self.key}.npz")
+
+    def load_cache(self):
+        """Return the cached data of the track, or None if it is not cached.
+
+        Returns:
+            dict: The preprocessed arrays of the track.
+        """
+        if not cf.TRACK_CACHE_DIR or not os.path.exists(self.get_cache_path()):
+            return None
+        with np.load(self.get_cache_path(), allow_pickle=False) as cache:
+            height, width = cache["shape"]
+            road = np.unpackbits(cache["road"], count=height*width).reshape(height, width)
+            return {"road": road.astype(bool),
+                    "start": cache["start"],
+                    "field": cache["field"],
+                    "progress": cache["progress"]}
+
+    def save_cache(self, data):
+        """Store the data of the track in the cache directory.
+
+        Args:
+            data (dict): The preprocessed arrays of the track.
+        """
+        if not cf.TRACK_CACHE_DIR:
+            return
+        os.makedirs(cf.TRACK_CACHE_DIR, exist_ok=True)
+        with atomic_write(self.get_cache_path(), ".npz") as temporary:
+            np.savez_compressed(temporary,
+                                shape=np.array(data["road"].shape),
+                                road=np.packbits(data["road"]),
+                                start=data["start"],
+                                field=data["field"],
+                                progress=data["progress"])
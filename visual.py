@@ -1,3 +1,10 @@
+import pygame as pg
+
+import config as cf
+from assets import LRUCache
+from neat import Layer
+from profiling import profiler
+
 COLORS = {
     'white': (255, 255, 255),
     'black': (0, 0, 0),
@@ -8,16 +15,19 @@ COLORS = {
 TEXT_COLOR = COLORS['white']
 BACKGROUND_COLOR = COLORS['black']
 PLOT_X, PLOT_HEIGHT, PLOT_LAYER_WIDTH = 600, 400, 200
+NODE_RADIUS = 10
+GENERAL_X, SELECTED_X, LINE_HEIGHT = 100, 1300, 50
+PROFILE_POS, PROFILE_LINE_HEIGHT = (10, 10), 30
 
 
-def get_general_text(simulation_length, current_time, generation, fitnesses, population):
+def get_general_text(simulation_length, current_time, generation, stats, population):
     """Returns the general information about the simulation as a list of strings.
 
     Args:
         simulation_length (float): The maximum time length of this generation.
         current_time (float): The amount of time that has passed this generation.
         generation (int): The number of the current generation.
-        fitnesses (list): All fitnesses of individuals in the latest generation.
+        stats (GenerationStats): The fitness statistics of past generations.
         population (int): Number of individuals in the simulation.
 
     Returns:
@@ -25,11 +35,11 @@ def get_general_text(simulation_length, current_time, generation, fitnesses, pop
     """
     return [f"Time remaining: {max((simulation_length-current_time)/1000,0)}",
             f"Generation: {generation}",
-            f"Avg. fitness: {round(sum(fitnesses)/len(fitnesses))}",
-            f"Median fitness: {round(fitnesses[len(fitnesses)//2])}",
-            f"Max fitness: {round(max(fitnesses))}",
+            f"Avg. fitness: {round(stats.last['mean'])}",
+            f"Median fitness: {round(stats.last['median'])}",
+            f"Max fitness: {round(stats.best)}",
             f"Amount of species: {len(population)}",
-            f"Individuals: {len([ind for species in population for ind in species.members])}"]
+            f"Individuals: {sum(len(species.members) for species in population)}"]
 
 
 def get_selected_text(selected):
@@ -41,5 +51,175 @@ def get_selected_text(selected):
     Returns:
         list: List with strings to display.
     """
-    return [f"Fitness: {round(selected.nn.fitness)}",
+    return [f"Fitness: {round(selected.fitness)}",
             f"Species ID: {sum(selected.color)}"]
+
+
+def get_profile_text(report):
+    """Returns the profiler's averages per step as a list of strings.
+
+    Args:
+        report (dict): The last report of the profiler.
+
+    Returns:
+        list: List with strings to display.
+    """
+    if not report:
+        return ["Profiling..."]
+    phases = sorted(report["phases_ms"].items(), key=lambda item: item[1], reverse=True)
+    return ([f"Step: {sum(report['phases_ms'].values()):.2f} ms"] +
+            [f"  {name}: {ms:.2f} ms" for name, ms in phases] +
+            [f"  {name}: {round(count)}" for name, count in report["counters"].items()])
+
+
+def get_network_layout(nn, top):
+    """Returns the position of every node of the network in the NN panel.
+
+    Args:
+        nn (NeuralNetwork): The neural network to lay out.
+        top (int): The top of the panel in the window.
+
+    Returns:
+        dict: The (x, y) position of each node by ID.
+    """
+    positions = {}
+    nodes_placed = [0, 0, 0]
+    for id, node in nn.nodes.items():
+        layer = node.type.value
+        x = PLOT_X + layer*PLOT_LAYER_WIDTH
+        dy = PLOT_HEIGHT/(nn.layer_size[layer]*2)
+        y = top + nodes_placed[layer]*dy + dy/2
+        positions[id] = (x, y)
+        nodes_placed[layer] += 1
+    return positions
+
+
+class Renderer:
+    """
+    Represents the drawing of the simulation onto the window in layers.
+
+    The track and background are drawn once into a surface. Every frame
+    only the areas drawn in the previous frame are restored from it, and
+    only those and the newly drawn areas are updated on the display. Text
+    surfaces are cached by their content, and the diagram of the selected
+    network is drawn into the background once per genome.
+
+    Attributes:
+    - window (pygame.Surface): The window to draw onto.
+    - font (pygame.font.Font): The font of all text.
+    - top (int): The top of the panels below the track.
+    - static (pygame.Surface): The background with the track.
+    - background (pygame.Surface): The background with the diagram of the
+        selected network.
+    - texts (LRUCache): The rendered text surfaces by content.
+    - dirty (list): The areas drawn in the previous frame.
+
+    Methods:
+    - text(line, pos): Draw a line of text and return its area.
+
+    - get_network(nn): Return the node positions of the network, drawing
+        its diagram into the background when it is newly selected.
+
+    - draw(sim, selected): Draw a frame of the simulation and update the display.
+    """
+
+    def __init__(self, window, track, font):
+        self.window = window
+        self.font = font
+        track_rect = track.image.get_rect()
+        self.top = track_rect.height
+        self.static = pg.Surface(window.get_size())
+        self.static.fill(BACKGROUND_COLOR)
+        self.static.blit(track.mask.to_surface(), track_rect)
+        self.background = self.static.copy()
+        self.panel = pg.Rect(PLOT_X - NODE_RADIUS, self.top - NODE_RADIUS,
+                             2*PLOT_LAYER_WIDTH + 2*NODE_RADIUS, PLOT_HEIGHT + 2*NODE_RADIUS)
+        self.texts = LRUCache(cf.ASSET_CACHE_SIZE)
+        self.network = None
+        self.dirty = []
+        window.blit(self.background, (0, 0))
+        pg.display.flip()
+
+    def text(self, line, pos):
+        surface = self.texts.get(line, lambda: self.font.render(line, True, TEXT_COLOR))
+        return self.window.blit(surface, pos)
+
+    def get_network(self, nn):
+        """Return the position of every node of the network in the NN panel.
+        When a different network is selected, its edges and nodes are drawn
+        into the background, so frames only restore them from there.
+
+        Args:
+            nn (NeuralNetwork): The selected neural network.
+
+        Returns:
+            dict: The (x, y) position of each node by ID.
+        """
+        key = (nn, len(nn.nodes), len(nn.edges))
+        if self.network is None or self.network[0] != key:
+            positions = get_network_layout(nn, self.top)
+            self.background.blit(self.static, self.panel, self.panel)
+            for (from_, to) in nn.edges:
+                pg.draw.line(self.background, COLORS['white'], positions[from_], positions[to])
+            for pos in positions.values():
+                pg.draw.circle(self.background, COLORS['red'], pos, radius=NODE_RADIUS)
+            self.window.blit(self.background, self.panel, self.panel)
+            self.dirty.append(self.panel.copy())
+            self.network = (key, positions)
+        return self.network[1]
+
+    def draw(self, sim, selected):
+        """Draw a frame of the simulation and update the changed areas of
+        the display.
+
+        Args:
+            sim (Simulation): The simulation to draw.
+            selected (Car): The individual selected by the user.
+        """
+        window = self.window
+        for rect in self.dirty:
+            window.blit(self.background, rect, rect)
+        rects = []
+
+        with profiler.phase("drawing"):
+            for individual in sim.individuals:
+                rects.append(individual.draw(window))
+            # Display which individual is selected.
+            rects.append(pg.draw.circle(window, selected.color, selected.get_center(), 30, 2))
+
+        # Display general text about the current state.
+        with profiler.phase("text"):
+            general_text = get_general_text(
+                sim.step_limit*1000/cf.STEPS_PER_SECOND, sim.steps*1000/cf.STEPS_PER_SECOND,
+                sim.neat.generation, sim.stats, sim.neat.population)
+            for i, line in enumerate(general_text):
+                rects.append(self.text(line, (GENERAL_X, self.top+LINE_HEIGHT*i)))
+
+        # Display the neural network of the selected individual:
+        if cf.SHOW_NN:
+            with profiler.phase("nn_panel"):
+                positions = self.get_network(selected.nn)
+                inputs, outputs = 0, 0
+                for id, node in selected.nn.nodes.items():
+                    x, y = positions[id]
+                    if node.type == Layer.INPUT:
+                        rects.append(self.text(f"{round(selected.inputs[inputs])}", (x-50, y-12)))
+                        inputs += 1
+                    elif node.type == Layer.OUTPUT:
+                        rects.append(self.text(f"{round(selected.outputs[outputs])}", (x+50, y-12)))
+                        outputs += 1
+
+        # Display information about the selected individual.
+        with profiler.phase("text"):
+            for i, line in enumerate(get_selected_text(selected)):
+                rects.append(self.text(line, (SELECTED_X, self.top+LINE_HEIGHT*i)))
+
+            # Display the profiler's averages:
+            if profiler.enabled and cf.SHOW_PROFILE:
+                x, y = PROFILE_POS
+                for i, line in enumerate(get_profile_text(profiler.report)):
+                    rects.append(self.text(line, (x, y+PROFILE_LINE_HEIGHT*i)))
+
+        with profiler.phase("display"):
+            pg.display.update(self.dirty + rects)
+        self.dirty = rects